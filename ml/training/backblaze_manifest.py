@@ -2,18 +2,25 @@
 from __future__ import annotations
 
 import argparse
-import json
+import html
 import re
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
 
 DEFAULT_SOURCE_URL = "https://www.backblaze.com/cloud-storage/resources/hard-drive-test-data"
 
+_QUARTER_RE_1 = re.compile(r"(?i)(?:^|[_\-])Q([1-4])[_\-]?((?:19|20)\d{2})")
+_QUARTER_RE_2 = re.compile(r"(?i)((?:19|20)\d{2})[_\-]?Q([1-4])")
+_ANNUAL_RE = re.compile(r"((?:19|20)\d{2})")
+_HREF_RE = re.compile(r"""href\s*=\s*["']([^"']+\.zip[^"']*)["']""", re.IGNORECASE)
+_ZIP_PATH_RE = re.compile(r"(?i)\.zip$")
+_CANDIDATE_MARKER_RE = re.compile(r"(?i)hard-drive-data|hard_drive_data|drive-stats|drivestats|backblaze")
+
 
 @dataclass(frozen=True)
 class ManifestEntry:
@@ -25,24 +32,18 @@ class ManifestEntry:
 
 
 def _extract_year_period(file_name: str) -> tuple[int | None, str]:
-    quarter_patterns = [
-        re.compile(r"(?i)(?:^|[_\-])Q([1-4])[_\-]?((?:19|20)\d{2})"),
-        re.compile(r"(?i)((?:19|20)\d{2})[_\-]?Q([1-4])"),
-    ]
-
-    for pattern in quarter_patterns:
+    for pattern, year_first in ((_QUARTER_RE_1, False), (_QUARTER_RE_2, True)):
         match = pattern.search(file_name)
         if not match:
             continue
 
-        groups = match.groups()
-        if pattern.pattern.startswith("(?i)(?:^|[_\\-])Q"):
-            quarter, year = groups
+        if year_first:
+            year, quarter = match.groups()
         else:
-            year, quarter = groups
+            quarter, year = match.groups()
         return int(year), f"Q{quarter}"
 
-    annual_match = re.search(r"((?:19|20)\d{2})", file_name)
+    annual_match = _ANNUAL_RE.search(file_name)
     if annual_match:
         return int(annual_match.group(1)), "ANNUAL"
 
@@ -50,21 +51,9 @@ def _extract_year_period(file_name: str) -> tuple[int | None, str]:
 
 
 def _is_candidate_zip(url: str) -> bool:
-    parsed = urlparse(url)
-    if not parsed.path.lower().endswith(".zip"):
+    if not _ZIP_PATH_RE.search(urlparse(url).path):
         return False
-
-    lowered = url.lower()
-    return any(
-        marker in lowered
-        for marker in [
-            "hard-drive-data",
-            "hard_drive_data",
-            "drive-stats",
-            "drivestats",
-            "backblaze",
-        ]
-    )
+    return _CANDIDATE_MARKER_RE.search(url) is not None
 
 
 def _period_order(period: str) -> int:
@@ -84,12 +73,11 @@ def build_manifest(
     response = requests.get(source_url, timeout=60)
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.text, "html.parser")
     seen: set[str] = set()
     entries: list[ManifestEntry] = []
 
-    for link in soup.find_all("a", href=True):
-        href = str(link["href"]).strip()
+    for match in _HREF_RE.finditer(response.text):
+        href = html.unescape(match.group(1)).strip()
         full_url = urljoin(source_url, href)
         if full_url in seen or not _is_candidate_zip(full_url):
             continue
@@ -143,7 +131,7 @@ def build_manifest(
     }
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    out_path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
     print(f"Saved manifest with {len(filtered)} datasets to {out_path}")
     return payload
 
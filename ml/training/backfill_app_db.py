@@ -2,46 +2,50 @@
 from __future__ import annotations
 
 import argparse
+import io
+import math
 from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any
 from uuid import uuid4
 
+import orjson
 import psycopg
+import pyarrow.csv as pacsv
 import requests
 import duckdb
 from psycopg.types.json import Json
 
+from duckdb_session import DuckDBSettings, add_duckdb_arguments, open_duckdb, union_by_name_required
 
-def _to_int(value: Any) -> int | None:
-    if value is None:
-        return None
-    try:
-        return int(value)
-    except (TypeError, ValueError):
-        return None
 
+# Columns loaded into telemetry_daily. _telemetry_query() selects exactly these
+# columns in this order, already cast to types Postgres accepts for them.
+TELEMETRY_COPY_COLUMNS: list[str] = [
+    "drive_id",
+    "day",
+    "smart_5",
+    "smart_187",
+    "smart_188",
+    "smart_197",
+    "smart_198",
+    "smart_199",
+    "temperature",
+    "is_failed_today",
+]
 
-def _to_float(value: Any) -> float | None:
-    if value is None:
-        return None
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
+
+# Drive sampling hashes serial numbers into this many buckets and keeps the
+# lowest ones, so a sampled selection is deterministic across runs.
+DRIVE_SAMPLE_BUCKETS = 1000
 
 
-def _to_bool(value: Any) -> bool:
-    if isinstance(value, bool):
-        return value
-    if value is None:
-        return False
-    return bool(value)
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
 
 
-def _resolve_latest_day(conn: duckdb.DuckDBPyConnection, parquet_glob: str) -> date:
+def _resolve_latest_day(conn: duckdb.DuckDBPyConnection, parquet_glob: str, union_by_name: bool) -> date:
     latest = conn.execute(
-        "SELECT MAX(CAST(date AS DATE)) FROM read_parquet(?, union_by_name=true)",
+        f"SELECT MAX(date) FROM read_parquet(?, union_by_name={str(union_by_name).lower()})",
         [parquet_glob],
     ).fetchone()[0]
     if latest is None:
@@ -49,15 +53,72 @@ def _resolve_latest_day(conn: duckdb.DuckDBPyConnection, parquet_glob: str) -> d
     return latest
 
 
-def _prepare_selected_drives(
+def _materialize_lookback(
     conn: duckdb.DuckDBPyConnection,
     parquet_glob: str,
     start_day: date,
     latest_day: date,
+    union_by_name: bool,
+) -> None:
+    # Every later query reads this window, so decode it from parquet once
+    # instead of re-scanning the warehouse for each of them.
+    conn.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE lookback AS
+        SELECT
+          serial_number,
+          date,
+          model,
+          capacity_bytes,
+          failure,
+          smart_5_raw,
+          smart_187_raw,
+          smart_188_raw,
+          smart_197_raw,
+          smart_198_raw,
+          smart_199_raw,
+          temperature
+        FROM read_parquet(?, union_by_name={str(union_by_name).lower()})
+        WHERE serial_number IS NOT NULL
+          AND date BETWEEN ? AND ?
+        """,
+        [parquet_glob, start_day, latest_day],
+    )
+
+
+def _drive_sample_threshold(
+    conn: duckdb.DuckDBPyConnection,
+    latest_day: date,
+    max_drives: int,
+) -> int | None:
+    snapshot_size = int(
+        conn.execute(
+            "SELECT COUNT(DISTINCT serial_number) FROM lookback WHERE date = ?",
+            [latest_day],
+        ).fetchone()[0]
+    )
+    if snapshot_size <= max_drives:
+        return None
+
+    # Oversample 2x so drives dropped by the history filter rarely leave the
+    # sample short of max_drives.
+    threshold = math.ceil(DRIVE_SAMPLE_BUCKETS * 2 * max_drives / snapshot_size)
+    return threshold if threshold < DRIVE_SAMPLE_BUCKETS else None
+
+
+def _prepare_selected_drives(
+    conn: duckdb.DuckDBPyConnection,
+    latest_day: date,
     min_history_days: int,
     max_drives: int | None,
+    sample_threshold: int | None = None,
 ) -> int:
     limit_clause = f"LIMIT {max_drives}" if max_drives and max_drives > 0 else ""
+    sample_clause = (
+        f"WHERE hash(serial_number) % {DRIVE_SAMPLE_BUCKETS} < {sample_threshold}"
+        if sample_threshold is not None
+        else ""
+    )
 
     conn.execute(
         f"""
@@ -65,37 +126,26 @@ def _prepare_selected_drives(
         WITH candidates AS (
           SELECT
             serial_number,
-            COUNT(DISTINCT CAST(date AS DATE)) AS history_days,
-            MAX(CASE WHEN CAST(date AS DATE) = ? THEN 1 ELSE 0 END) AS seen_on_latest_day
-          FROM read_parquet(?, union_by_name=true)
-          WHERE serial_number IS NOT NULL
-            AND CAST(date AS DATE) BETWEEN ? AND ?
+            COUNT(DISTINCT date) AS history_days,
+            MAX(CASE WHEN date = ? THEN 1 ELSE 0 END) AS seen_on_latest_day
+          FROM lookback
+          {sample_clause}
           GROUP BY serial_number
-          HAVING COUNT(DISTINCT CAST(date AS DATE)) >= ?
-            AND MAX(CASE WHEN CAST(date AS DATE) = ? THEN 1 ELSE 0 END) = 1
+          HAVING COUNT(DISTINCT date) >= ?
+            AND MAX(CASE WHEN date = ? THEN 1 ELSE 0 END) = 1
         )
         SELECT
           t.serial_number,
           COALESCE(ANY_VALUE(NULLIF(TRIM(t.model), '')), 'UNKNOWN') AS model,
           MAX(TRY_CAST(t.capacity_bytes AS BIGINT)) AS capacity_bytes
-        FROM read_parquet(?, union_by_name=true) t
+        FROM lookback t
         INNER JOIN candidates c ON c.serial_number = t.serial_number
-        WHERE CAST(t.date AS DATE) = ?
-          AND t.serial_number IS NOT NULL
+        WHERE t.date = ?
         GROUP BY t.serial_number
         ORDER BY t.serial_number
         {limit_clause}
         """,
-        [
-            latest_day,
-            parquet_glob,
-            start_day,
-            latest_day,
-            min_history_days,
-            latest_day,
-            parquet_glob,
-            latest_day,
-        ],
+        [latest_day, min_history_days, latest_day, latest_day],
     )
 
     return int(conn.execute("SELECT COUNT(*) FROM selected_drives").fetchone()[0])
@@ -104,8 +154,8 @@ def _prepare_selected_drives(
 def _telemetry_query() -> str:
     return """
       SELECT
-        t.serial_number AS drive_id,
-        CAST(t.date AS DATE) AS day,
+        CAST(t.serial_number AS VARCHAR) AS drive_id,
+        t.date AS day,
         TRY_CAST(t.smart_5_raw AS BIGINT) AS smart5,
         TRY_CAST(t.smart_187_raw AS BIGINT) AS smart187,
         TRY_CAST(t.smart_188_raw AS BIGINT) AS smart188,
@@ -113,15 +163,10 @@ def _telemetry_query() -> str:
         TRY_CAST(t.smart_198_raw AS BIGINT) AS smart198,
         TRY_CAST(t.smart_199_raw AS BIGINT) AS smart199,
         TRY_CAST(t.temperature AS DOUBLE) AS temperature,
-        CASE WHEN TRY_CAST(t.failure AS INTEGER) = 1 THEN TRUE ELSE FALSE END AS is_failed_today,
-        COALESCE(sd.model, NULLIF(TRIM(t.model), ''), 'UNKNOWN') AS model,
-        COALESCE(sd.capacity_bytes, TRY_CAST(t.capacity_bytes AS BIGINT)) AS capacity_bytes
-      FROM read_parquet(?, union_by_name=true) t
+        COALESCE(TRY_CAST(t.failure AS INTEGER) = 1, FALSE) AS is_failed_today
+      FROM lookback t
       INNER JOIN selected_drives sd
         ON t.serial_number = sd.serial_number
-      WHERE t.serial_number IS NOT NULL
-        AND CAST(t.date AS DATE) BETWEEN ? AND ?
-      ORDER BY t.serial_number, CAST(t.date AS DATE)
     """
 
 
@@ -131,17 +176,33 @@ def _drive_summary_query() -> str:
         sd.serial_number AS drive_id,
         COALESCE(NULLIF(TRIM(sd.model), ''), 'UNKNOWN') AS model,
         sd.capacity_bytes AS capacity_bytes,
-        MIN(CAST(t.date AS DATE)) AS first_seen,
-        MAX(CAST(t.date AS DATE)) AS last_seen
+        MIN(t.date) AS first_seen,
+        MAX(t.date) AS last_seen
       FROM selected_drives sd
-      INNER JOIN read_parquet(?, union_by_name=true) t
+      INNER JOIN lookback t
         ON t.serial_number = sd.serial_number
-      WHERE CAST(t.date AS DATE) BETWEEN ? AND ?
       GROUP BY sd.serial_number, sd.model, sd.capacity_bytes
       ORDER BY sd.serial_number
     """
 
 
+def _insert_telemetry_via_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    database_url: str,
+) -> int:
+    conn.execute("INSTALL postgres")
+    conn.execute("LOAD postgres")
+    conn.execute(f"ATTACH {_sql_literal(database_url)} AS pg (TYPE POSTGRES)")
+    try:
+        copy_columns = ", ".join(TELEMETRY_COPY_COLUMNS)
+        inserted = conn.execute(
+            f"INSERT INTO pg.public.telemetry_daily ({copy_columns}) {_telemetry_query()}"
+        ).fetchone()[0]
+    finally:
+        conn.execute("DETACH pg")
+    return int(inserted)
+
+
 def backfill(
     warehouse_dir: Path,
     database_url: str,
@@ -152,36 +213,49 @@ def backfill(
     clear_existing: bool,
     latest_day: date | None,
     score_url: str | None,
+    telemetry_loader: str = "copy",
+    sample_drives: bool = False,
+    duckdb_settings: DuckDBSettings | None = None,
 ) -> None:
     parquet_glob = str(warehouse_dir / "**" / "*.parquet")
-    conn = duckdb.connect(database=":memory:")
+    conn = open_duckdb(duckdb_settings, preserve_insertion_order=False)
 
-    resolved_latest_day = latest_day or _resolve_latest_day(conn, parquet_glob)
+    union_by_name = union_by_name_required(conn, parquet_glob)
+    resolved_latest_day = latest_day or _resolve_latest_day(conn, parquet_glob, union_by_name)
     start_day = resolved_latest_day - timedelta(days=lookback_days)
+    _materialize_lookback(conn, parquet_glob, start_day, resolved_latest_day, union_by_name)
+
+    sample_threshold = None
+    if sample_drives and max_drives:
+        sample_threshold = _drive_sample_threshold(conn, resolved_latest_day, max_drives)
+
     selected_drive_count = _prepare_selected_drives(
         conn,
-        parquet_glob,
-        start_day,
         resolved_latest_day,
         min_history_days,
         max_drives,
+        sample_threshold,
     )
+    if sample_threshold is not None and max_drives and selected_drive_count < max_drives:
+        selected_drive_count = _prepare_selected_drives(
+            conn,
+            resolved_latest_day,
+            min_history_days,
+            max_drives,
+        )
     if selected_drive_count == 0:
         raise RuntimeError(
             "No drives matched selection. Reduce --min-history-days or increase available warehouse history."
         )
 
     drive_records: list[tuple[str, str, int | None, str, date, date]] = []
-    for row in conn.execute(
-        _drive_summary_query(),
-        [parquet_glob, start_day, resolved_latest_day],
-    ).fetchall():
+    for row in conn.execute(_drive_summary_query()).fetchall():
         drive_id, model, capacity_bytes, first_seen, last_seen = row
         drive_records.append(
             (
                 str(drive_id),
                 str(model or "UNKNOWN"),
-                _to_int(capacity_bytes),
+                capacity_bytes,
                 "backblaze",
                 first_seen,
                 last_seen,
@@ -203,7 +277,35 @@ def backfill(
                     """
                 )
 
-            cur.executemany(
+            cur.execute(
+                """
+                CREATE TEMP TABLE drives_staging (
+                  drive_id TEXT,
+                  model TEXT,
+                  capacity_bytes BIGINT,
+                  datacenter TEXT,
+                  first_seen DATE,
+                  last_seen DATE
+                ) ON COMMIT DROP
+                """
+            )
+            with cur.copy(
+                """
+                COPY drives_staging (
+                  drive_id,
+                  model,
+                  capacity_bytes,
+                  datacenter,
+                  first_seen,
+                  last_seen
+                ) FROM STDIN (FORMAT BINARY)
+                """
+            ) as copy:
+                copy.set_types(["text", "text", "int8", "text", "date", "date"])
+                for record in drive_records:
+                    copy.write_row(record)
+
+            cur.execute(
                 """
                 INSERT INTO drives (
                   drive_id,
@@ -213,7 +315,8 @@ def backfill(
                   first_seen,
                   last_seen
                 )
-                VALUES (%s, %s, %s, %s, %s, %s)
+                SELECT drive_id, model, capacity_bytes, datacenter, first_seen, last_seen
+                FROM drives_staging
                 ON CONFLICT (drive_id) DO UPDATE
                 SET
                   model = EXCLUDED.model,
@@ -221,55 +324,31 @@ def backfill(
                   datacenter = EXCLUDED.datacenter,
                   first_seen = LEAST(drives.first_seen, EXCLUDED.first_seen),
                   last_seen = GREATEST(drives.last_seen, EXCLUDED.last_seen)
-                """,
-                drive_records,
+                """
             )
 
-        with pg_conn.cursor() as cur:
-            with cur.copy(
-                """
-                COPY telemetry_daily (
-                  drive_id,
-                  day,
-                  smart_5,
-                  smart_187,
-                  smart_188,
-                  smart_197,
-                  smart_198,
-                  smart_199,
-                  temperature,
-                  io_read_latency_ms,
-                  io_write_latency_ms,
-                  is_failed_today
-                ) FROM STDIN
-                """
-            ) as copy:
-                reader = conn.execute(
-                    _telemetry_query(),
-                    [parquet_glob, start_day, resolved_latest_day],
-                ).fetch_record_batch(rows_per_batch=batch_size)
-
-                for batch in reader:
-                    for row in batch.to_pylist():
-                        drive_id = str(row["drive_id"])
-
-                        copy.write_row(
-                            (
-                                drive_id,
-                                row["day"],
-                                _to_int(row["smart5"]),
-                                _to_int(row["smart187"]),
-                                _to_int(row["smart188"]),
-                                _to_int(row["smart197"]),
-                                _to_int(row["smart198"]),
-                                _to_int(row["smart199"]),
-                                _to_float(row["temperature"]),
-                                None,
-                                None,
-                                _to_bool(row["is_failed_today"]),
-                            )
-                        )
-                        telemetry_inserted += 1
+        if telemetry_loader == "duckdb":
+            # DuckDB writes through its own Postgres connection, so the truncate
+            # and drive rows it depends on have to be committed first.
+            pg_conn.commit()
+            telemetry_inserted = _insert_telemetry_via_duckdb(conn, database_url)
+        else:
+            # Arrow renders each batch as CSV in C++, so rows never become Python
+            # objects. Strings are always quoted and nulls left bare, which is
+            # how Postgres CSV tells NULL apart from an empty string.
+            copy_columns = ", ".join(TELEMETRY_COPY_COLUMNS)
+            write_options = pacsv.WriteOptions(include_header=False)
+            with pg_conn.cursor() as cur:
+                with cur.copy(f"COPY telemetry_daily ({copy_columns}) FROM STDIN (FORMAT CSV)") as copy:
+                    reader = conn.execute(_telemetry_query()).fetch_record_batch(
+                        rows_per_batch=batch_size
+                    )
+
+                    for batch in reader:
+                        buffer = io.BytesIO()
+                        pacsv.write_csv(batch, buffer, write_options)
+                        copy.write(buffer.getbuffer())
+                        telemetry_inserted += batch.num_rows
 
         with pg_conn.cursor() as cur:
             cur.execute(
@@ -286,13 +365,14 @@ def backfill(
                     Json(
                         {
                             "source": "backblaze-warehouse",
-                            "latest_day": resolved_latest_day.isoformat(),
-                            "start_day": start_day.isoformat(),
+                            "latest_day": resolved_latest_day,
+                            "start_day": start_day,
                             "selected_drives": len(drive_records),
                             "min_history_days": min_history_days,
                             "inserted_telemetry_rows": telemetry_inserted,
-                            "loaded_at": datetime.now(timezone.utc).isoformat(),
-                        }
+                            "loaded_at": datetime.now(timezone.utc),
+                        },
+                        dumps=orjson.dumps,
                     )
                 ],
             )
@@ -339,6 +419,18 @@ def main() -> None:
     parser.add_argument("--latest-day", type=date.fromisoformat, default=None)
     parser.add_argument("--score-url", type=str, default=None)
     parser.add_argument("--no-clear-existing", action="store_true")
+    parser.add_argument(
+        "--telemetry-loader",
+        choices=["copy", "duckdb"],
+        default="copy",
+        help="copy streams rows through psycopg COPY; duckdb inserts server-side via the DuckDB postgres extension",
+    )
+    parser.add_argument(
+        "--sample-drives",
+        action="store_true",
+        help="Pick --max-drives from a deterministic hash sample of serial numbers instead of the first N by serial",
+    )
+    add_duckdb_arguments(parser)
     args = parser.parse_args()
 
     if not args.warehouse.exists():
@@ -355,6 +447,9 @@ def main() -> None:
         clear_existing=not args.no_clear_existing,
         latest_day=args.latest_day,
         score_url=args.score_url,
+        telemetry_loader=args.telemetry_loader,
+        sample_drives=args.sample_drives,
+        duckdb_settings=DuckDBSettings.from_args(args),
     )
 
 
@@ -5,7 +5,7 @@ import argparse
 import shutil
 from pathlib import Path
 
-import duckdb
+from duckdb_session import DuckDBSettings, add_duckdb_arguments, open_duckdb, union_by_name_required
 
 SMART_FEATURE_COLUMNS = [
     "smart_5_raw",
@@ -24,23 +24,27 @@ def _sql_literal(value: str) -> str:
     return "'" + value.replace("'", "''") + "'"
 
 
+def _base_select_exprs() -> str:
+    expressions = [
+        "date AS as_of_date",
+        "serial_number",
+        "model",
+        "TRY_CAST(failure AS INTEGER) AS failure",
+        "TRY_CAST(capacity_bytes AS BIGINT) AS capacity_bytes",
+    ]
+    expressions.extend(f"TRY_CAST({column} AS DOUBLE) AS {column}" for column in SMART_FEATURE_COLUMNS)
+    return ",\n              ".join(expressions)
+
+
 def _window_feature_exprs() -> str:
+    # Grouped by window so aggregates over the same frame sit together; the
+    # 7d delta and the increasing flag are derived from these in the final CTE.
     expressions: list[str] = []
-    for column in SMART_FEATURE_COLUMNS:
-        expressions.extend(
-            [
-                f"AVG({column}) OVER w7 AS {column}_mean_7d",
-                f"AVG({column}) OVER w30 AS {column}_mean_30d",
-                f"STDDEV_POP({column}) OVER w30 AS {column}_std_30d",
-                f"{column} - AVG({column}) OVER w7 AS {column}_delta_vs_7d",
-                (
-                    f"CASE WHEN {column} > LAG({column}) OVER "
-                    f"(PARTITION BY serial_number ORDER BY as_of_date) THEN 1 ELSE 0 END "
-                    f"AS {column}_is_increasing"
-                ),
-            ]
-        )
-    return ",\n      ".join(expressions)
+    expressions.extend(f"AVG({column}) OVER w7 AS {column}_mean_7d" for column in SMART_FEATURE_COLUMNS)
+    expressions.extend(f"AVG({column}) OVER w30 AS {column}_mean_30d" for column in SMART_FEATURE_COLUMNS)
+    expressions.extend(f"STDDEV_POP({column}) OVER w30 AS {column}_std_30d" for column in SMART_FEATURE_COLUMNS)
+    expressions.extend(f"LAG({column}) OVER w_lag AS {column}_lag_1d" for column in SMART_FEATURE_COLUMNS)
+    return ",\n              ".join(expressions)
 
 
 def build_features(
@@ -48,16 +52,20 @@ def build_features(
     out_dir: Path,
     horizon_days: int,
     row_limit: int | None,
+    duckdb_settings: DuckDBSettings | None = None,
 ) -> None:
     if not warehouse_dir.exists():
         raise FileNotFoundError(f"Warehouse not found: {warehouse_dir}")
 
     out_dir.mkdir(parents=True, exist_ok=True)
-    conn = duckdb.connect(database=":memory:")
+    conn = open_duckdb(duckdb_settings, preserve_insertion_order=False)
 
+    base_exprs = _base_select_exprs()
     feature_exprs = _window_feature_exprs()
     limit_clause = f"LIMIT {row_limit}" if row_limit and row_limit > 0 else ""
-    warehouse_glob_literal = _sql_literal(str(warehouse_dir / "**" / "*.parquet"))
+    warehouse_glob = str(warehouse_dir / "**" / "*.parquet")
+    warehouse_glob_literal = _sql_literal(warehouse_glob)
+    union_by_name = str(union_by_name_required(conn, warehouse_glob)).lower()
     out_literal = _sql_literal(str(out_dir))
 
     conn.execute(
@@ -65,32 +73,20 @@ def build_features(
         COPY (
           WITH base AS (
             SELECT
-              CAST(date AS DATE) AS as_of_date,
-              serial_number,
-              model,
-              TRY_CAST(failure AS INTEGER) AS failure,
-              TRY_CAST(capacity_bytes AS BIGINT) AS capacity_bytes,
-              TRY_CAST(smart_5_raw AS DOUBLE) AS smart_5_raw,
-              TRY_CAST(smart_187_raw AS DOUBLE) AS smart_187_raw,
-              TRY_CAST(smart_188_raw AS DOUBLE) AS smart_188_raw,
-              TRY_CAST(smart_197_raw AS DOUBLE) AS smart_197_raw,
-              TRY_CAST(smart_198_raw AS DOUBLE) AS smart_198_raw,
-              TRY_CAST(smart_199_raw AS DOUBLE) AS smart_199_raw,
-              TRY_CAST(smart_241_raw AS DOUBLE) AS smart_241_raw,
-              TRY_CAST(smart_242_raw AS DOUBLE) AS smart_242_raw,
-              TRY_CAST(temperature AS DOUBLE) AS temperature
-            FROM read_parquet({warehouse_glob_literal}, union_by_name=true)
+              {base_exprs}
+            FROM read_parquet({warehouse_glob_literal}, union_by_name={union_by_name}, hive_partitioning=false)
             WHERE date IS NOT NULL
               AND serial_number IS NOT NULL
           ), enriched AS (
             SELECT
               *,
-              MIN(as_of_date) OVER (PARTITION BY serial_number) AS first_seen_date,
-              MIN(CASE WHEN failure = 1 THEN as_of_date END)
-                OVER (PARTITION BY serial_number) AS failure_date,
+              MIN(as_of_date) OVER w_drive AS first_seen_date,
+              MIN(CASE WHEN failure = 1 THEN as_of_date END) OVER w_drive AS failure_date,
               {feature_exprs}
             FROM base
             WINDOW
+              w_drive AS (PARTITION BY serial_number),
+              w_lag AS (PARTITION BY serial_number ORDER BY as_of_date),
               w7 AS (PARTITION BY serial_number ORDER BY as_of_date ROWS BETWEEN 6 PRECEDING AND CURRENT ROW),
               w30 AS (PARTITION BY serial_number ORDER BY as_of_date ROWS BETWEEN 29 PRECEDING AND CURRENT ROW)
           ), final AS (
@@ -101,16 +97,15 @@ def build_features(
               capacity_bytes,
               DATE_DIFF('day', first_seen_date, as_of_date) AS age_days,
               CASE
-                WHEN failure_date > as_of_date
-                  AND failure_date <= as_of_date + INTERVAL '{horizon_days} day'
+                WHEN DATE_DIFF('day', as_of_date, failure_date) BETWEEN 1 AND $horizon_days
                 THEN 1
                 ELSE 0
               END AS label_30d,
               {', '.join([f'{column}_mean_7d' for column in SMART_FEATURE_COLUMNS])},
               {', '.join([f'{column}_mean_30d' for column in SMART_FEATURE_COLUMNS])},
               {', '.join([f'{column}_std_30d' for column in SMART_FEATURE_COLUMNS])},
-              {', '.join([f'{column}_delta_vs_7d' for column in SMART_FEATURE_COLUMNS])},
-              {', '.join([f'{column}_is_increasing' for column in SMART_FEATURE_COLUMNS])},
+              {', '.join([f'{column} - {column}_mean_7d AS {column}_delta_vs_7d' for column in SMART_FEATURE_COLUMNS])},
+              {', '.join([f'COALESCE(({column} > {column}_lag_1d)::INTEGER, 0) AS {column}_is_increasing' for column in SMART_FEATURE_COLUMNS])},
               EXTRACT(YEAR FROM as_of_date) AS year,
               LPAD(CAST(EXTRACT(MONTH FROM as_of_date) AS VARCHAR), 2, '0') AS month
             FROM enriched
@@ -124,7 +119,8 @@ def build_features(
           OVERWRITE_OR_IGNORE TRUE,
           COMPRESSION ZSTD
         )
-        """
+        """,
+        {"horizon_days": horizon_days},
     )
 
     conn.close()
@@ -137,6 +133,7 @@ def main() -> None:
     parser.add_argument("--horizon-days", type=int, default=30)
     parser.add_argument("--row-limit", type=int, default=None)
     parser.add_argument("--clean", action="store_true")
+    add_duckdb_arguments(parser)
     args = parser.parse_args()
 
     if args.clean and args.out.exists():
@@ -147,6 +144,7 @@ def main() -> None:
         out_dir=args.out,
         horizon_days=args.horizon_days,
         row_limit=args.row_limit,
+        duckdb_settings=DuckDBSettings.from_args(args),
     )
     print(f"Feature build complete: {args.out}")
 
@@ -2,12 +2,21 @@
 from __future__ import annotations
 
 import argparse
+import csv
+import functools
+import io
 import shutil
-import tempfile
 import zipfile
-from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Iterator
 
 import duckdb
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from duckdb_session import DuckDBSettings, add_duckdb_arguments, open_duckdb
 
 CANONICAL_COLUMNS: list[tuple[str, str, list[str]]] = [
     ("date", "DATE", ["date", "day"]),
@@ -26,6 +35,11 @@ CANONICAL_COLUMNS: list[tuple[str, str, list[str]]] = [
     ("temperature", "DOUBLE", ["temperature", "temperature_raw", "smart_194_raw", "smart_194"]),
 ]
 
+_CANONICAL_ALIASES_LOWER: list[tuple[str, str, tuple[str, ...]]] = [
+    (canonical_name, sql_type, tuple(alias.lower() for alias in aliases))
+    for canonical_name, sql_type, aliases in CANONICAL_COLUMNS
+]
+
 
 def _quote(identifier: str) -> str:
     return f'"{identifier.replace("\"", "\"\"")}"'
@@ -35,22 +49,31 @@ def _sql_literal(value: str) -> str:
     return "'" + value.replace("'", "''") + "'"
 
 
-def _column_names(conn: duckdb.DuckDBPyConnection, csv_path: Path) -> set[str]:
-    query = "SELECT * FROM read_csv_auto(?, header=true, all_varchar=true, ignore_errors=true, sample_size=-1) LIMIT 0"
-    relation = conn.execute(query, [str(csv_path)])
-    return {description[0] for description in relation.description}
+def _column_names(archive: zipfile.ZipFile, member: str) -> frozenset[str]:
+    with archive.open(member) as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+        header = next(csv.reader(text), [])
+    return frozenset(header)
 
 
-def _canonical_select_exprs(available_columns: set[str]) -> str:
+@functools.lru_cache(maxsize=32)
+def _resolve_source_columns(available_columns: frozenset[str]) -> tuple[tuple[str, str, str | None], ...]:
     available_lookup = {name.lower(): name for name in available_columns}
-    exprs: list[str] = []
-
-    for canonical_name, sql_type, aliases in CANONICAL_COLUMNS:
-        source_column = next(
-            (available_lookup[alias.lower()] for alias in aliases if alias.lower() in available_lookup),
-            None,
+    return tuple(
+        (
+            canonical_name,
+            sql_type,
+            next((available_lookup[alias] for alias in aliases if alias in available_lookup), None),
         )
+        for canonical_name, sql_type, aliases in _CANONICAL_ALIASES_LOWER
+    )
 
+
+@functools.lru_cache(maxsize=32)
+def _canonical_select_exprs(available_columns: frozenset[str]) -> str:
+    exprs: list[str] = []
+
+    for canonical_name, sql_type, source_column in _resolve_source_columns(available_columns):
         if source_column is None:
             exprs.append(f"NULL::{sql_type} AS {_quote(canonical_name)}")
             continue
@@ -70,51 +93,117 @@ def _canonical_select_exprs(available_columns: set[str]) -> str:
     return ",\n      ".join(exprs)
 
 
-def _ingest_csv(conn: duckdb.DuckDBPyConnection, csv_path: Path, out_dir: Path) -> None:
-    available_columns = _column_names(conn, csv_path)
+def _csv_stream(
+    archive: zipfile.ZipFile,
+    members: list[str],
+    include_columns: list[str],
+    workers: int,
+) -> pa.RecordBatchReader:
+    schema = pa.schema([(name, pa.string()) for name in include_columns])
+    parse_options = pacsv.ParseOptions(invalid_row_handler=lambda _row: "skip")
+    convert_options = pacsv.ConvertOptions(
+        include_columns=include_columns,
+        column_types=schema,
+        strings_can_be_null=False,
+    )
+
+    def read_member(member: str) -> pa.Table:
+        with archive.open(member) as file_obj:
+            return pacsv.read_csv(
+                file_obj,
+                parse_options=parse_options,
+                convert_options=convert_options,
+            )
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        # Inflating and parsing a member both release the GIL, so a few members
+        # are read ahead on worker threads while DuckDB consumes the current one.
+        # ZipFile serializes reads of the shared file handle internally.
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            pending: deque[Future[pa.Table]] = deque()
+            for member in members:
+                pending.append(executor.submit(read_member, member))
+                if len(pending) >= workers:
+                    yield from pending.popleft().result().to_batches()
+            while pending:
+                yield from pending.popleft().result().to_batches()
+
+    return pa.RecordBatchReader.from_batches(schema, batches())
+
+
+def _ingest_csv_group(
+    conn: duckdb.DuckDBPyConnection,
+    archive: zipfile.ZipFile,
+    members: list[str],
+    available_columns: frozenset[str],
+    out_dir: Path,
+    csv_workers: int,
+) -> None:
+    include_columns = list(
+        dict.fromkeys(
+            source_column
+            for _, _, source_column in _resolve_source_columns(available_columns)
+            if source_column is not None
+        )
+    )
+    if not include_columns:
+        return
+
     select_exprs = _canonical_select_exprs(available_columns)
-    csv_literal = _sql_literal(str(csv_path))
     out_literal = _sql_literal(str(out_dir))
 
-    conn.execute(
-        f"""
-        COPY (
-          WITH source AS (
-            SELECT
-              {select_exprs}
-            FROM read_csv_auto({csv_literal}, header=true, all_varchar=true, ignore_errors=true, sample_size=-1)
-          ), normalized AS (
-            SELECT
-              *,
-              EXTRACT(YEAR FROM date) AS year,
-              LPAD(CAST(EXTRACT(MONTH FROM date) AS VARCHAR), 2, '0') AS month
-            FROM source
-            WHERE date IS NOT NULL
-              AND serial_number IS NOT NULL
-          )
-          SELECT * FROM normalized
-        ) TO {out_literal} (
-          FORMAT PARQUET,
-          PARTITION_BY (year, month),
-          APPEND TRUE,
-          COMPRESSION ZSTD
+    conn.register("csv_stream", _csv_stream(archive, members, include_columns, csv_workers))
+    try:
+        conn.execute(
+            f"""
+            COPY (
+              WITH source AS (
+                SELECT
+                  {select_exprs}
+                FROM csv_stream
+              ), normalized AS (
+                SELECT
+                  *,
+                  EXTRACT(YEAR FROM date) AS year,
+                  LPAD(CAST(EXTRACT(MONTH FROM date) AS VARCHAR), 2, '0') AS month
+                FROM source
+                WHERE date IS NOT NULL
+                  AND serial_number IS NOT NULL
+              )
+              SELECT * FROM normalized
+              ORDER BY serial_number, date
+            ) TO {out_literal} (
+              FORMAT PARQUET,
+              PARTITION_BY (year, month),
+              APPEND TRUE,
+              COMPRESSION ZSTD,
+              ROW_GROUP_SIZE 100000
+            )
+            """
         )
-        """
-    )
+    finally:
+        conn.unregister("csv_stream")
 
 
-def _is_metadata_csv(path: Path) -> bool:
+def _is_metadata_csv(path: PurePosixPath) -> bool:
     if path.name.startswith("._"):
         return True
     return "__MACOSX" in path.parts
 
 
-def build_warehouse(zips_dir: Path, out_dir: Path, max_csv_files: int | None = None) -> int:
+def build_warehouse(
+    zips_dir: Path,
+    out_dir: Path,
+    max_csv_files: int | None = None,
+    duckdb_settings: DuckDBSettings | None = None,
+    csv_workers: int = 4,
+) -> int:
     if not zips_dir.exists():
         raise FileNotFoundError(f"ZIP directory not found: {zips_dir}")
 
     out_dir.mkdir(parents=True, exist_ok=True)
-    conn = duckdb.connect(database=":memory:")
+    # Insertion order is kept so each COPY's ORDER BY survives PARTITION_BY.
+    conn = open_duckdb(duckdb_settings)
 
     processed_csv_count = 0
     zip_paths = sorted(zips_dir.glob("*.zip"))
@@ -122,20 +211,31 @@ def build_warehouse(zips_dir: Path, out_dir: Path, max_csv_files: int | None = N
         raise RuntimeError(f"No ZIP files found in {zips_dir}")
 
     for zip_path in zip_paths:
-        with tempfile.TemporaryDirectory(prefix="backblaze_extract_") as temp_dir:
-            temp_root = Path(temp_dir)
-            with zipfile.ZipFile(zip_path, "r") as archive:
-                archive.extractall(temp_root)
-
-            for csv_path in sorted(temp_root.rglob("*.csv")):
-                if _is_metadata_csv(csv_path):
-                    continue
-                _ingest_csv(conn, csv_path, out_dir)
-                processed_csv_count += 1
-                if max_csv_files and processed_csv_count >= max_csv_files:
-                    print(f"Reached --max_csv_files={max_csv_files}; stopping ingest")
-                    conn.close()
-                    return processed_csv_count
+        # CSVs are streamed straight out of the archive through pyarrow's CSV
+        # reader, so nothing is extracted to disk before DuckDB sees it.
+        with zipfile.ZipFile(zip_path, "r") as archive:
+            members = [
+                member
+                for member in sorted(archive.namelist())
+                if member.endswith(".csv") and not _is_metadata_csv(PurePosixPath(member))
+            ]
+            if max_csv_files:
+                members = members[: max_csv_files - processed_csv_count]
+
+            # Daily CSVs in one ZIP almost always share a header, so grouping by
+            # column set lets a single COPY cover many files.
+            groups: dict[frozenset[str], list[str]] = {}
+            for member in members:
+                groups.setdefault(_column_names(archive, member), []).append(member)
+
+            for columns, group_members in groups.items():
+                _ingest_csv_group(conn, archive, group_members, columns, out_dir, csv_workers)
+
+        processed_csv_count += len(members)
+        if max_csv_files and processed_csv_count >= max_csv_files:
+            print(f"Reached --max_csv_files={max_csv_files}; stopping ingest")
+            conn.close()
+            return processed_csv_count
 
     conn.close()
     return processed_csv_count
@@ -156,12 +256,25 @@ def main() -> None:
         action="store_true",
         help="Remove warehouse directory before rebuild",
     )
+    parser.add_argument(
+        "--csv-workers",
+        type=int,
+        default=4,
+        help="CSV files inflated and parsed concurrently",
+    )
+    add_duckdb_arguments(parser)
     args = parser.parse_args()
 
     if args.clean and args.out.exists():
         shutil.rmtree(args.out)
 
-    count = build_warehouse(zips_dir=args.zips, out_dir=args.out, max_csv_files=args.max_csv_files)
+    count = build_warehouse(
+        zips_dir=args.zips,
+        out_dir=args.out,
+        max_csv_files=args.max_csv_files,
+        duckdb_settings=DuckDBSettings.from_args(args),
+        csv_workers=args.csv_workers,
+    )
     print(f"Warehouse build complete. Processed CSV files: {count}. Output: {args.out}")
 
 
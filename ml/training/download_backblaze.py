@@ -3,55 +3,172 @@ from __future__ import annotations
 
 import argparse
 import json
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import requests
 
 
-def _remote_size(session: requests.Session, url: str) -> int | None:
+def _content_range_total(response: requests.Response) -> int | None:
+    # Content-Range looks like "bytes 0-99/1234" on 206 and "bytes */1234" on 416.
+    _, _, total = response.headers.get("Content-Range", "").rpartition("/")
+    return int(total) if total.isdigit() else None
+
+
+# Files are only split into ranged requests when every part gets at least this
+# many bytes; below that the extra connections cost more than they gain.
+RANGE_PART_MIN_BYTES = 64 * 1024 * 1024
+
+# Read size for response bodies; large reads keep the copy loop out of Python.
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class _RangeNotSupported(Exception):
+    pass
+
+
+def _fetch_range(url: str, fd: int, start: int, end: int, stop: threading.Event) -> None:
+    # Sessions are not shared across threads, so each range opens its own.
+    # ``stop`` is set once another range has failed; the whole file is thrown
+    # away then, so there is no point reading the rest of this one.
+    with requests.Session() as session:
+        with session.get(
+            url,
+            timeout=120,
+            stream=True,
+            headers={"Range": f"bytes={start}-{end}"},
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise _RangeNotSupported
+
+            response.raw.decode_content = True
+            offset = start
+            while chunk := response.raw.read(COPY_CHUNK_BYTES):
+                if stop.is_set():
+                    return
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+
+    if offset != end + 1:
+        raise RuntimeError(f"Short range read: expected bytes {start}-{end}, got up to {offset - 1}")
+
+
+def _download_ranges(url: str, target: Path, size: int, parts: int) -> bool:
+    """Fetch ``url`` as ``parts`` concurrent byte ranges written straight into place.
+
+    Returns False when the server ignores Range requests, leaving the caller to
+    fall back to a single stream.
+    """
+    part_size = math.ceil(size / parts)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    # Write into a side file so an interrupted run never leaves a full-size,
+    # partly empty target that would later pass the size check.
+    part_path = target.with_name(target.name + ".part")
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
     try:
-        response = session.head(url, timeout=30, allow_redirects=True)
-        response.raise_for_status()
-        content_length = response.headers.get("Content-Length")
-        if content_length:
-            return int(content_length)
-    except Exception:
-        return None
-    return None
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(_fetch_range, url, fd, start, end, stop) for start, end in ranges]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # Fail fast: the executor still joins the running ranges before
+                # the descriptor is closed, but they give up at their next read.
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    except _RangeNotSupported:
+        os.close(fd)
+        part_path.unlink(missing_ok=True)
+        return False
+    except BaseException:
+        os.close(fd)
+        part_path.unlink(missing_ok=True)
+        raise
 
+    os.close(fd)
+    os.replace(part_path, target)
+    return True
 
-def _download_with_resume(session: requests.Session, url: str, target: Path) -> None:
-    expected_size = _remote_size(session, url)
+
+def _download_with_resume(
+    session: requests.Session,
+    url: str,
+    target: Path,
+    parts_per_file: int = 1,
+) -> None:
     existing_size = target.stat().st_size if target.exists() else 0
 
-    if expected_size is not None and existing_size == expected_size:
-        print(f"Skip (already complete): {target.name}")
-        return
-
-    headers: dict[str, str] = {}
-    mode = "wb"
-
-    if target.exists() and expected_size is not None and existing_size < expected_size:
-        headers["Range"] = f"bytes={existing_size}-"
-        mode = "ab"
-        print(f"Resuming {target.name} at byte {existing_size}")
-    elif target.exists() and expected_size is not None and existing_size > expected_size:
-        target.unlink()
-        existing_size = 0
-    elif target.exists() and expected_size is None:
-        print(f"Skip (size unknown, file exists): {target.name}")
-        return
-
-    with session.get(url, timeout=120, stream=True, headers=headers) as response:
-        if response.status_code == 416 and expected_size is not None:
-            print(f"Skip (range complete): {target.name}")
-            return
+    # A single ranged GET both reports the remote size (via Content-Range) and
+    # starts the transfer, so no separate HEAD round-trip is needed.
+    with session.get(
+        url,
+        timeout=120,
+        stream=True,
+        headers={"Range": f"bytes={existing_size}-"},
+    ) as response:
+        if response.status_code == 416:
+            if existing_size == 0:
+                response.raise_for_status()
+
+            remote_size = _content_range_total(response)
+            if remote_size is None:
+                # Without a total there is nothing to compare against; a 416 for
+                # the bytes past our end means the file is most likely complete.
+                print(f"Skip (size unknown, file exists): {target.name}")
+                return
+            if remote_size == existing_size:
+                print(f"Skip (already complete): {target.name}")
+                return
+
+            # The local file no longer matches the remote size; start over.
+            target.unlink()
+            return _download_with_resume(session, url, target, parts_per_file)
 
         response.raise_for_status()
-        with target.open(mode) as file_obj:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    file_obj.write(chunk)
+
+        if response.status_code == 206:
+            expected_size = _content_range_total(response)
+        else:
+            # The server ignored the Range header and is sending the whole file.
+            content_length = response.headers.get("Content-Length")
+            expected_size = int(content_length) if content_length else None
+            if existing_size and expected_size is None:
+                print(f"Skip (size unknown, file exists): {target.name}")
+                return
+            if existing_size and existing_size == expected_size:
+                print(f"Skip (already complete): {target.name}")
+                return
+            existing_size = 0
+
+        if existing_size == 0 and response.status_code == 206 and expected_size is not None:
+            parts = min(parts_per_file, expected_size // RANGE_PART_MIN_BYTES)
+            if parts > 1:
+                response.close()
+                if _download_ranges(url, target, expected_size, parts):
+                    print(f"Downloaded: {target.name} ({expected_size} bytes in {parts} ranges)")
+                    return
+                return _download_with_resume(session, url, target, parts_per_file=1)
+
+        if existing_size:
+            print(f"Resuming {target.name} at byte {existing_size}")
+
+        response.raw.decode_content = True
+        with target.open("ab" if existing_size else "wb") as file_obj:
+            shutil.copyfileobj(response.raw, file_obj, COPY_CHUNK_BYTES)
 
     final_size = target.stat().st_size
     if expected_size is not None and final_size != expected_size:
@@ -62,7 +179,13 @@ def _download_with_resume(session: requests.Session, url: str, target: Path) ->
     print(f"Downloaded: {target.name} ({final_size} bytes)")
 
 
-def download_from_manifest(manifest_path: Path, dest_dir: Path, max_files: int | None) -> list[Path]:
+def download_from_manifest(
+    manifest_path: Path,
+    dest_dir: Path,
+    max_files: int | None,
+    workers: int = 4,
+    parts_per_file: int = 4,
+) -> list[Path]:
     if not manifest_path.exists():
         raise FileNotFoundError(f"Manifest not found: {manifest_path}")
 
@@ -75,15 +198,29 @@ def download_from_manifest(manifest_path: Path, dest_dir: Path, max_files: int |
         datasets = datasets[:max_files]
 
     dest_dir.mkdir(parents=True, exist_ok=True)
-    downloaded_paths: list[Path] = []
 
-    with requests.Session() as session:
-        for item in datasets:
-            url = str(item["url"])
-            file_name = str(item["file_name"])
-            target = dest_dir / file_name
-            _download_with_resume(session, url, target)
-            downloaded_paths.append(target)
+    # Each worker thread keeps its own Session, since requests does not
+    # guarantee a Session is safe to share across threads.
+    thread_state = threading.local()
+    sessions: list[requests.Session] = []
+
+    def download(item: dict) -> Path:
+        session = getattr(thread_state, "session", None)
+        if session is None:
+            session = requests.Session()
+            thread_state.session = session
+            sessions.append(session)
+
+        target = dest_dir / str(item["file_name"])
+        _download_with_resume(session, str(item["url"]), target, parts_per_file)
+        return target
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            downloaded_paths = list(executor.map(download, datasets))
+    finally:
+        for session in sessions:
+            session.close()
 
     print(f"Ready ZIP files: {len(downloaded_paths)} in {dest_dir}")
     return downloaded_paths
@@ -107,9 +244,27 @@ def main() -> None:
         default=None,
         help="Limit files for smoke tests",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Files downloaded concurrently",
+    )
+    parser.add_argument(
+        "--parts-per-file",
+        type=int,
+        default=4,
+        help="Concurrent byte ranges per large file (1 disables ranged downloads)",
+    )
     args = parser.parse_args()
 
-    download_from_manifest(manifest_path=args.manifest, dest_dir=args.dest, max_files=args.max_files)
+    download_from_manifest(
+        manifest_path=args.manifest,
+        dest_dir=args.dest,
+        max_files=args.max_files,
+        workers=args.workers,
+        parts_per_file=args.parts_per_file,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""Shared DuckDB connection setup for the training pipeline scripts."""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+
+
+@dataclass(frozen=True)
+class DuckDBSettings:
+    threads: int | None = None
+    memory_limit: str | None = None
+    temp_directory: Path | None = None
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> DuckDBSettings:
+        return cls(
+            threads=args.duckdb_threads,
+            memory_limit=args.duckdb_memory_limit,
+            temp_directory=args.duckdb_temp_dir,
+        )
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def add_duckdb_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("DuckDB")
+    group.add_argument("--duckdb-threads", type=int, default=None, help="Worker threads (default: all cores)")
+    group.add_argument(
+        "--duckdb-memory-limit",
+        type=str,
+        default=None,
+        help="Memory limit such as 16GB (default: 80%% of RAM)",
+    )
+    group.add_argument(
+        "--duckdb-temp-dir",
+        type=Path,
+        default=None,
+        help="Spill directory for operators that exceed the memory limit",
+    )
+
+
+def open_duckdb(
+    settings: DuckDBSettings | None = None,
+    preserve_insertion_order: bool = True,
+) -> duckdb.DuckDBPyConnection:
+    """Open an in-memory DuckDB connection tuned for large parquet scans.
+
+    Pass ``preserve_insertion_order=False`` only when nothing depends on the
+    order rows are produced in; DuckDB then pipelines batches out of order,
+    which would also scramble ORDER BY output written with PARTITION_BY.
+    """
+    settings = settings or DuckDBSettings()
+    conn = duckdb.connect(database=":memory:")
+
+    if settings.threads:
+        conn.execute(f"SET threads = {int(settings.threads)}")
+    if settings.memory_limit:
+        conn.execute(f"SET memory_limit = {_sql_literal(settings.memory_limit)}")
+    if settings.temp_directory:
+        conn.execute(f"SET temp_directory = {_sql_literal(str(settings.temp_directory))}")
+    conn.execute("SET enable_object_cache = true")
+    if not preserve_insertion_order:
+        conn.execute("SET preserve_insertion_order = false")
+
+    return conn
+
+
+def union_by_name_required(conn: duckdb.DuckDBPyConnection, parquet_glob: str) -> bool:
+    """Return True unless every parquet file under the glob shares one schema.
+
+    DuckDB binds columns by name across files, so ``union_by_name`` only earns
+    its per-file schema merge when files disagree on their columns or types.
+    """
+    signature_count = conn.execute(
+        """
+        SELECT COUNT(DISTINCT signature)
+        FROM (
+          SELECT
+            file_name,
+            string_agg(name || ' ' || COALESCE(type, '') || ' ' || COALESCE(converted_type, ''), ',' ORDER BY name)
+              AS signature
+          FROM parquet_schema(?)
+          GROUP BY file_name
+        )
+        """,
+        [parquet_glob],
+    ).fetchone()[0]
+    return signature_count > 1
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from train_streaming import _recall_at_top_fractions
+
+
+def _reference_recall(y_true: np.ndarray, scores: np.ndarray, fraction: float) -> float:
+    # Full sort with ties broken by row index.
+    k = max(1, int(len(scores) * fraction))
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    return float(y_true[order[:k]].sum() / y_true.sum())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_recall_at_top_fractions_breaks_ties_by_row_index(seed: int) -> None:
+    # A few distinct scores over many rows put large ties across both cut-offs,
+    # with positives spread unevenly through each tie.
+    rng = np.random.default_rng(seed)
+    scores = rng.choice([0.02, 0.1, 0.3, 0.3, 0.7], size=2000)
+    y_true = (rng.random(2000) < np.where(scores >= 0.3, 0.2, 0.02)).astype(np.int64)
+    fractions = [0.01, 0.05, 0.25]
+
+    expected = [_reference_recall(y_true, scores, fraction) for fraction in fractions]
+    assert _recall_at_top_fractions(y_true, scores, fractions) == expected
+
+
+def test_recall_at_top_fractions_counts_only_the_first_tied_rows() -> None:
+    scores = np.full(200, 0.5)
+    y_true = np.zeros(200, dtype=np.int64)
+    y_true[[0, 150, 199]] = 1
+
+    # The top row is row 0 alone; the top 5% is rows 0-9.
+    assert _recall_at_top_fractions(y_true, scores, [0.005, 0.05]) == [1 / 3, 1 / 3]
@@ -3,7 +3,9 @@ from __future__ import annotations
 
 import argparse
 import hashlib
-import json
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
@@ -12,11 +14,15 @@ from typing import Iterable
 import duckdb
 import joblib
 import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
 from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import average_precision_score, brier_score_loss
 from sklearn.preprocessing import StandardScaler
 
+from duckdb_session import DuckDBSettings, add_duckdb_arguments, open_duckdb, union_by_name_required
+
 NUMERIC_TYPES = {
     "BIGINT",
     "INTEGER",
@@ -51,15 +57,16 @@ class DatasetSplit:
     cutoff_date: datetime
 
 
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
 def _sha256(path: Path) -> str:
     if not path.exists():
         return "manifest_missing"
 
-    digest = hashlib.sha256()
     with path.open("rb") as file_obj:
-        for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
-            digest.update(chunk)
-    return digest.hexdigest()
+        return hashlib.file_digest(file_obj, "sha256").hexdigest()
 
 
 def _as_datetime(value) -> datetime:
@@ -67,9 +74,13 @@ def _as_datetime(value) -> datetime:
     return timestamp.to_pydatetime().replace(tzinfo=timezone.utc)
 
 
-def discover_numeric_features(conn: duckdb.DuckDBPyConnection, feature_glob: str) -> list[str]:
+def discover_numeric_features(
+    conn: duckdb.DuckDBPyConnection,
+    feature_glob: str,
+    union_by_name: bool = True,
+) -> list[str]:
     rows = conn.execute(
-        "DESCRIBE SELECT * FROM read_parquet(?, union_by_name=true)",
+        f"DESCRIBE SELECT * FROM read_parquet(?, union_by_name={str(union_by_name).lower()})",
         [feature_glob],
     ).fetchall()
 
@@ -91,11 +102,27 @@ def resolve_split(
     conn: duckdb.DuckDBPyConnection,
     feature_glob: str,
     test_months: int,
+    union_by_name: bool = True,
 ) -> DatasetSplit:
-    min_date, max_date = conn.execute(
-        "SELECT MIN(as_of_date), MAX(as_of_date) FROM read_parquet(?, union_by_name=true)",
+    # Row-group statistics give the date range without reading any data pages.
+    # If a row group lacks them (e.g. written without statistics), scan instead.
+    row_groups, with_stats, min_date, max_date = conn.execute(
+        """
+        SELECT
+          COUNT(*),
+          COUNT(stats_min_value),
+          MIN(CAST(stats_min_value AS DATE)),
+          MAX(CAST(stats_max_value AS DATE))
+        FROM parquet_metadata(?)
+        WHERE path_in_schema = 'as_of_date'
+        """,
         [feature_glob],
     ).fetchone()
+    if row_groups == 0 or with_stats < row_groups:
+        min_date, max_date = conn.execute(
+            f"SELECT MIN(as_of_date), MAX(as_of_date) FROM read_parquet(?, union_by_name={str(union_by_name).lower()})",
+            [feature_glob],
+        ).fetchone()
 
     if min_date is None or max_date is None:
         raise RuntimeError("Features dataset is empty")
@@ -115,82 +142,153 @@ def resolve_split(
     )
 
 
-def iter_batches(
+def prepare_batch_statements(
     conn: duckdb.DuckDBPyConnection,
     feature_glob: str,
     numeric_features: list[str],
+    union_by_name: bool = True,
+) -> None:
+    """Prepare the train and test batch scans once; iter_batches executes them."""
+    # Only the label and features are projected; as_of_date is used purely as
+    # a filter, so its column chunks are never decoded into the batch.
+    for mode, comparator in (("train", "<="), ("test", ">")):
+        conn.execute(
+            f"""
+            PREPARE {mode}_batches AS
+            SELECT
+              label_30d,
+              {', '.join(numeric_features)}
+            FROM read_parquet({_sql_literal(feature_glob)}, union_by_name={str(union_by_name).lower()})
+            WHERE as_of_date {comparator} $1
+              AND label_30d IS NOT NULL
+            """
+        )
+
+
+def iter_batches(
+    conn: duckdb.DuckDBPyConnection,
     split: DatasetSplit,
     mode: str,
     batch_size: int,
     max_batches: int | None = None,
-) -> Iterable[pd.DataFrame]:
-    comparator = "<=" if mode == "train" else ">"
-
-    query = f"""
-      SELECT
-        as_of_date,
-        label_30d,
-        {', '.join(numeric_features)}
-      FROM read_parquet(?, union_by_name=true)
-      WHERE as_of_date {comparator} ?
-        AND label_30d IS NOT NULL
-    """
-
+    prefetch: int = 2,
+) -> Iterable[pa.RecordBatch]:
+    # EXECUTE only takes literal arguments; an ISO date literal is safe to inline.
     reader = conn.execute(
-        query,
-        [feature_glob, split.cutoff_date.date()],
+        f"EXECUTE {mode}_batches(DATE '{split.cutoff_date.date().isoformat()}')"
     ).fetch_record_batch(rows_per_batch=batch_size)
 
-    yielded = 0
-    for batch in reader:
-        frame = batch.to_pandas()
-        if frame.empty:
-            continue
-
-        yield frame
-        yielded += 1
-        if max_batches is not None and yielded >= max_batches:
-            break
+    def read_next() -> pa.RecordBatch | None:
+        try:
+            return reader.read_next_batch()
+        except StopIteration:
+            return None
 
-
-def _recall_at_top_fraction(y_true: np.ndarray, scores: np.ndarray, fraction: float) -> float:
+    # DuckDB decodes with the GIL released, so the next batches are fetched on
+    # a single worker thread while the caller fits the current one. One worker
+    # keeps the reads in order.
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending: deque[Future[pa.RecordBatch | None]] = deque(
+            executor.submit(read_next) for _ in range(max(1, prefetch))
+        )
+        while pending:
+            batch = pending.popleft().result()
+            if batch is None:
+                break
+            pending.append(executor.submit(read_next))
+            if batch.num_rows == 0:
+                continue
+
+            yield batch
+            yielded += 1
+            if max_batches is not None and yielded >= max_batches:
+                break
+
+
+def _feature_matrix(batch: pa.RecordBatch, numeric_features: list[str]) -> np.ndarray:
+    # Arrow columns are copied contiguously into a column-major staging matrix
+    # (nulls arrive as NaN) and transposed once into row-major order, which is
+    # cheaper than strided column writes. SGDClassifier.partial_fit copies any
+    # non-C-contiguous input and StandardScaler.transform keeps the layout, so
+    # a column-major matrix would be copied again on every fit. float32 halves
+    # the bytes SGD streams through; StandardScaler still accumulates its
+    # statistics in float64.
+    staging = np.empty((batch.num_rows, len(numeric_features)), dtype=np.float32, order="F")
+    for index, feature in enumerate(numeric_features):
+        staging[:, index] = batch.column(feature).to_numpy(zero_copy_only=False)
+    x = np.ascontiguousarray(staging)
+    x[~np.isfinite(x)] = 0.0
+    return x
+
+
+def _labels(batch: pa.RecordBatch) -> np.ndarray:
+    return batch.column("label_30d").to_numpy().astype(np.int64)
+
+
+def _cached_batch(x: np.ndarray, y: np.ndarray) -> pa.RecordBatch:
+    # The row-major matrix is stored as one fixed-size-list column, so it wraps
+    # without a copy here and reads back as a single contiguous block.
+    features = pa.FixedSizeListArray.from_arrays(pa.array(x.reshape(-1)), x.shape[1])
+    return pa.RecordBatch.from_arrays([features, pa.array(y)], names=["features", "label_30d"])
+
+
+def _iter_cached_batches(path: Path) -> Iterable[tuple[np.ndarray, np.ndarray]]:
+    # Cached features are already sanitized float32 in row-major order, so
+    # each batch is one contiguous copy out of the map rather than a transpose.
+    # Both arrays are copies and stay valid once the map closes.
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            features = batch.column("features")
+            x = features.flatten().to_numpy().reshape(batch.num_rows, features.type.list_size).copy()
+            yield x, _labels(batch)
+
+
+def _recall_at_top_fractions(y_true: np.ndarray, scores: np.ndarray, fractions: list[float]) -> list[float]:
     if len(y_true) == 0:
-        return 0.0
+        return [0.0 for _ in fractions]
 
     positives = y_true.sum()
     if positives == 0:
-        return 0.0
+        return [0.0 for _ in fractions]
 
-    k = max(1, int(len(scores) * fraction))
-    top_indices = np.argsort(scores)[::-1][:k]
-    return float(y_true[top_indices].sum() / positives)
+    ks = [max(1, int(len(scores) * fraction)) for fraction in fractions]
+    k_max = max(ks)
+    # Partition once for the largest k, then order just that slice so every
+    # smaller top-k is a prefix of it. Every row tied with the k-th score is
+    # kept and ties go to the lower row index, so the cut never depends on
+    # which tied rows the partition happened to place inside it.
+    kth_score = np.partition(scores, len(scores) - k_max)[len(scores) - k_max]
+    candidates = np.flatnonzero(scores >= kth_score)
+    top_indices = candidates[np.lexsort((candidates, -scores[candidates]))][:k_max]
+    hits = np.cumsum(y_true[top_indices])
+    return [float(hits[k - 1] / positives) for k in ks]
 
 
 def _calibration_bins(y_true: np.ndarray, scores: np.ndarray, bins: int = 10) -> list[dict[str, float]]:
     edges = np.linspace(0.0, 1.0, bins + 1)
-    result: list[dict[str, float]] = []
 
-    for idx in range(bins):
-        left, right = edges[idx], edges[idx + 1]
-        if idx == bins - 1:
-            mask = (scores >= left) & (scores <= right)
-        else:
-            mask = (scores >= left) & (scores < right)
-
-        if not np.any(mask):
-            continue
-
-        result.append(
-            {
-                "bin_left": float(left),
-                "bin_right": float(right),
-                "predicted_mean": float(scores[mask].mean()),
-                "observed_rate": float(y_true[mask].mean()),
-                "count": int(mask.sum()),
-            }
-        )
-
-    return result
+    # Bins are [left, right) except the last, which is closed at 1.0. digitize
+    # against the interior edges gives exactly that, and scores outside [0, 1]
+    # are left out as before.
+    in_range = (scores >= 0.0) & (scores <= 1.0)
+    bin_ids = np.digitize(scores[in_range], edges[1:-1])
+    counts = np.bincount(bin_ids, minlength=bins)
+    score_sums = np.bincount(bin_ids, weights=scores[in_range], minlength=bins)
+    label_sums = np.bincount(bin_ids, weights=y_true[in_range].astype(np.float64), minlength=bins)
+
+    return [
+        {
+            "bin_left": float(edges[idx]),
+            "bin_right": float(edges[idx + 1]),
+            "predicted_mean": float(score_sums[idx] / counts[idx]),
+            "observed_rate": float(label_sums[idx] / counts[idx]),
+            "count": int(counts[idx]),
+        }
+        for idx in np.flatnonzero(counts)
+    ]
 
 
 def train_streaming(
@@ -202,70 +300,103 @@ def train_streaming(
     manifest_path: Path,
     max_train_batches: int | None,
     max_test_batches: int | None,
+    duckdb_settings: DuckDBSettings | None = None,
+    cache_train_batches: bool = True,
 ) -> Path:
     feature_glob = str(features_dir / "**" / "*.parquet")
-    conn = duckdb.connect(database=":memory:")
-
-    numeric_features = discover_numeric_features(conn, feature_glob)
-    split = resolve_split(conn, feature_glob, test_months=test_months)
-
-    scaler = StandardScaler(with_mean=True, with_std=True)
-    class_counts = {0: 0, 1: 0}
-    for batch in iter_batches(
-        conn,
-        feature_glob,
-        numeric_features,
-        split,
-        mode="train",
-        batch_size=batch_size,
-        max_batches=max_train_batches,
-    ):
-        x = batch[numeric_features].replace([np.inf, -np.inf], np.nan).fillna(0.0).to_numpy(dtype=np.float64)
-        y = batch["label_30d"].astype(int).to_numpy()
-        scaler.partial_fit(x)
-        class_counts[0] += int((y == 0).sum())
-        class_counts[1] += int((y == 1).sum())
-
-    classifier = SGDClassifier(
-        loss="log_loss",
-        penalty="l2",
-        alpha=1e-5,
-        random_state=42,
-    )
-    total_train = class_counts[0] + class_counts[1]
-    if total_train == 0:
-        raise RuntimeError("No training rows available after split")
-
-    class_weights = {
-        0: (total_train / (2 * class_counts[0])) if class_counts[0] > 0 else 1.0,
-        1: (total_train / (2 * class_counts[1])) if class_counts[1] > 0 else 1.0,
-    }
+    # Insertion order is kept so SGD sees batches in the same order every run.
+    conn = open_duckdb(duckdb_settings)
+
+    union_by_name = union_by_name_required(conn, feature_glob)
+    numeric_features = discover_numeric_features(conn, feature_glob, union_by_name)
+    split = resolve_split(conn, feature_glob, test_months=test_months, union_by_name=union_by_name)
+    prepare_batch_statements(conn, feature_glob, numeric_features, union_by_name)
+
+    # The SGD pass needs the same training batches as the scaler pass. Unless
+    # disabled, the sanitized batches are spilled to an Arrow IPC file on the
+    # first pass so the second reads them back instead of decoding parquet again.
+    cache_dir = tempfile.TemporaryDirectory(prefix="reliscore-train-") if cache_train_batches else None
+    cache_path = Path(cache_dir.name) / "train.arrow" if cache_dir else None
+    cache_writer: pa.ipc.RecordBatchFileWriter | None = None
+
+    # Both passes run under try/finally so an error or interrupt mid-epoch
+    # still closes the writer and removes a possibly multi-GB cache.
+    try:
+        scaler = StandardScaler(with_mean=True, with_std=True)
+        class_counts = {0: 0, 1: 0}
+        for batch in iter_batches(
+            conn,
+            split,
+            mode="train",
+            batch_size=batch_size,
+            max_batches=max_train_batches,
+        ):
+            x = _feature_matrix(batch, numeric_features)
+            y = _labels(batch)
+            scaler.partial_fit(x)
+            class_counts[0] += int((y == 0).sum())
+            class_counts[1] += int((y == 1).sum())
+
+            if cache_path is not None:
+                cached = _cached_batch(x, y)
+                if cache_writer is None:
+                    cache_writer = pa.ipc.new_file(str(cache_path), cached.schema)
+                cache_writer.write_batch(cached)
+
+        if cache_writer is not None:
+            cache_writer.close()
+
+        classifier = SGDClassifier(
+            loss="log_loss",
+            penalty="l2",
+            alpha=1e-5,
+            random_state=42,
+        )
+        total_train = class_counts[0] + class_counts[1]
+        if total_train == 0:
+            raise RuntimeError("No training rows available after split")
 
-    is_first_batch = True
-    for batch in iter_batches(
-        conn,
-        feature_glob,
-        numeric_features,
-        split,
-        mode="train",
-        batch_size=batch_size,
-        max_batches=max_train_batches,
-    ):
-        x = batch[numeric_features].replace([np.inf, -np.inf], np.nan).fillna(0.0).to_numpy(dtype=np.float64)
-        y = batch["label_30d"].astype(int).to_numpy()
-        sample_weight = np.where(y == 1, class_weights[1], class_weights[0]).astype(np.float64)
+        class_weights = {
+            0: (total_train / (2 * class_counts[0])) if class_counts[0] > 0 else 1.0,
+            1: (total_train / (2 * class_counts[1])) if class_counts[1] > 0 else 1.0,
+        }
 
-        x_scaled = scaler.transform(x)
-        if is_first_batch:
-            classifier.partial_fit(
-                x_scaled,
-                y,
-                classes=np.array([0, 1]),
-                sample_weight=sample_weight,
-            )
-            is_first_batch = False
+        if cache_writer is not None:
+            train_batches = _iter_cached_batches(cache_path)
         else:
-            classifier.partial_fit(x_scaled, y, sample_weight=sample_weight)
+            train_batches = (
+                (_feature_matrix(batch, numeric_features), _labels(batch))
+                for batch in iter_batches(
+                    conn,
+                    split,
+                    mode="train",
+                    batch_size=batch_size,
+                    max_batches=max_train_batches,
+                )
+            )
+
+        is_first_batch = True
+        for x, y in train_batches:
+            sample_weight = np.where(y == 1, class_weights[1], class_weights[0]).astype(np.float32)
+
+            # Each batch matrix is a fresh row-major copy, so it is scaled in
+            # place and handed to partial_fit without another copy.
+            x_scaled = scaler.transform(x, copy=False)
+            if is_first_batch:
+                classifier.partial_fit(
+                    x_scaled,
+                    y,
+                    classes=np.array([0, 1]),
+                    sample_weight=sample_weight,
+                )
+                is_first_batch = False
+            else:
+                classifier.partial_fit(x_scaled, y, sample_weight=sample_weight)
+    finally:
+        if cache_writer is not None:
+            cache_writer.close()
+        if cache_dir is not None:
+            cache_dir.cleanup()
 
     if is_first_batch:
         raise RuntimeError("No training batches yielded rows. Check features dataset and split.")
@@ -275,15 +406,13 @@ def train_streaming(
 
     for batch in iter_batches(
         conn,
-        feature_glob,
-        numeric_features,
         split,
         mode="test",
         batch_size=batch_size,
         max_batches=max_test_batches,
     ):
-        x = batch[numeric_features].replace([np.inf, -np.inf], np.nan).fillna(0.0).to_numpy(dtype=np.float64)
-        y = batch["label_30d"].astype(int).to_numpy()
+        x = _feature_matrix(batch, numeric_features)
+        y = _labels(batch)
         x_scaled = scaler.transform(x)
         scores = classifier.predict_proba(x_scaled)[:, 1]
 
@@ -295,15 +424,13 @@ def train_streaming(
         # evaluating on a small train sample so end-to-end health checks still pass.
         for batch in iter_batches(
             conn,
-            feature_glob,
-            numeric_features,
             split,
             mode="train",
             batch_size=batch_size,
             max_batches=max_test_batches or 1,
         ):
-            x = batch[numeric_features].replace([np.inf, -np.inf], np.nan).fillna(0.0).to_numpy(dtype=np.float64)
-            y = batch["label_30d"].astype(int).to_numpy()
+            x = _feature_matrix(batch, numeric_features)
+            y = _labels(batch)
             x_scaled = scaler.transform(x)
             scores = classifier.predict_proba(x_scaled)[:, 1]
             y_true_chunks.append(y)
@@ -314,12 +441,13 @@ def train_streaming(
 
     y_true = np.concatenate(y_true_chunks)
     y_scores = np.concatenate(score_chunks)
+    recall_at_top_1pct, recall_at_top_5pct = _recall_at_top_fractions(y_true, y_scores, [0.01, 0.05])
 
     metrics = {
         "pr_auc": float(average_precision_score(y_true, y_scores)),
         "brier_score": float(brier_score_loss(y_true, y_scores)),
-        "recall_at_top_1pct": _recall_at_top_fraction(y_true, y_scores, 0.01),
-        "recall_at_top_5pct": _recall_at_top_fraction(y_true, y_scores, 0.05),
+        "recall_at_top_1pct": recall_at_top_1pct,
+        "recall_at_top_5pct": recall_at_top_5pct,
         "test_rows": int(len(y_true)),
         "positive_rate_test": float(y_true.mean()),
         "calibration": _calibration_bins(y_true, y_scores, bins=10),
@@ -348,21 +476,30 @@ def train_streaming(
         "horizon_days": horizon_days,
     }
     joblib.dump(bundle, artifact_dir / "model.joblib")
+    # The scoring service only needs the linear weights; it reads them from here
+    # and keeps the joblib bundle for metadata and older artifacts.
+    np.savez(
+        artifact_dir / "weights.npz",
+        coef=classifier.coef_,
+        intercept=classifier.intercept_,
+        mean=scaler.mean_,
+        scale=scaler.scale_,
+    )
 
     feature_schema = {
         "ordered_features": [{"name": feature, "dtype": "float"} for feature in numeric_features],
         "label_column": "label_30d",
         "horizon_days": horizon_days,
     }
-    (artifact_dir / "feature_schema.json").write_text(
-        json.dumps(feature_schema, indent=2),
-        encoding="utf-8",
+    (artifact_dir / "feature_schema.json").write_bytes(
+        orjson.dumps(feature_schema, option=orjson.OPT_INDENT_2),
     )
 
-    (artifact_dir / "metrics.json").write_text(json.dumps(metrics, indent=2), encoding="utf-8")
+    (artifact_dir / "metrics.json").write_bytes(orjson.dumps(metrics, option=orjson.OPT_INDENT_2))
 
     version_meta = {
         "model_version": model_version,
+        "model_type": bundle["model_type"],
         "horizon_days": horizon_days,
         "train_date": datetime.now(timezone.utc).isoformat(),
         "train_range": {
@@ -375,7 +512,7 @@ def train_streaming(
         },
         "dataset_manifest_hash": _sha256(manifest_path),
     }
-    (artifact_dir / "version.json").write_text(json.dumps(version_meta, indent=2), encoding="utf-8")
+    (artifact_dir / "version.json").write_bytes(orjson.dumps(version_meta, option=orjson.OPT_INDENT_2))
 
     model_card = f"""# Model Card - {model_version}
 
@@ -417,6 +554,12 @@ def main() -> None:
     parser.add_argument("--test-months", type=int, default=9)
     parser.add_argument("--max-train-batches", type=int, default=None)
     parser.add_argument("--max-test-batches", type=int, default=None)
+    parser.add_argument(
+        "--no-batch-cache",
+        action="store_true",
+        help="Re-scan parquet for the SGD pass instead of caching training batches under TMPDIR",
+    )
+    add_duckdb_arguments(parser)
     args = parser.parse_args()
 
     train_streaming(
@@ -428,6 +571,8 @@ def main() -> None:
         manifest_path=args.manifest,
         max_train_batches=args.max_train_batches,
         max_test_batches=args.max_test_batches,
+        duckdb_settings=DuckDBSettings.from_args(args),
+        cache_train_batches=not args.no_batch_cache,
     )
 
 
@@ -2,26 +2,87 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.openapi.utils import validation_error_definition, validation_error_response_definition
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter, ValidationError
 
 from app.model_loader import ModelStore
 from app.schemas import (
-  BatchScoreRequest,
   HealthResponse,
   ModelInfoResponse,
-  ScoreRequest,
   ScoreResponse,
+  build_request_adapters,
 )
 
+_COMPONENT_REF = "#/components/schemas/{model}"
+
+
+def _json_body_openapi(schema_name: str) -> dict:
+    # What FastAPI would document for a declared body parameter: the request
+    # schema plus its 422 validation error response.
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": {"$ref": _COMPONENT_REF.format(model=schema_name)}}},
+            "required": True,
+        },
+        "responses": {
+            "422": {
+                "description": "Validation Error",
+                "content": {
+                    "application/json": {
+                        "schema": {"$ref": _COMPONENT_REF.format(model="HTTPValidationError")},
+                    },
+                },
+            },
+        },
+    }
+
+
+def _validate_body(adapter: TypeAdapter, body: bytes):
+    try:
+        return adapter.validate_json(body)
+    except ValidationError as error:
+        raise RequestValidationError(
+            [{**item, "loc": ("body", *item["loc"])} for item in error.errors(include_url=False)],
+            body=body,
+        ) from error
+
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="ReliScore Model Service",
         description="FastAPI service for drive failure-risk scoring",
         version="0.1.0",
+        default_response_class=ORJSONResponse,
     )
     model_store = ModelStore()
-    model_store.load()
+    loaded = model_store.load()
+
+    # Request schemas are closed over the loaded model's features, so both
+    # scoring endpoints read the raw body and validate it with these adapters.
+    # They are published to OpenAPI by hand for the same reason.
+    score_adapter, batch_adapter = build_request_adapters(tuple(loaded.feature_columns))
+    request_schemas = batch_adapter.json_schema(ref_template=_COMPONENT_REF)
+    request_components = {
+        **request_schemas.pop("$defs"),
+        "BatchScoreRequest": request_schemas,
+        "HTTPValidationError": validation_error_response_definition,
+        "ValidationError": validation_error_definition,
+    }
+
+    default_openapi = app.openapi
+
+    def openapi() -> dict:
+        if app.openapi_schema is None:
+            schema = default_openapi()
+            schema.setdefault("components", {}).setdefault("schemas", {}).update(request_components)
+        return app.openapi_schema
+
+    app.openapi = openapi
 
     @app.get("/health", response_model=HealthResponse)
     def health() -> HealthResponse:
@@ -31,7 +92,8 @@ def create_app() -> FastAPI:
 
     @app.get("/model/info", response_model=ModelInfoResponse)
     def model_info() -> ModelInfoResponse:
-        loaded = model_store.loaded or model_store.load()
+        loaded = model_store.loaded
+        assert loaded is not None
         return ModelInfoResponse(
             model_version=loaded.model_version,
             model_type=loaded.model_type,
@@ -40,8 +102,8 @@ def create_app() -> FastAPI:
             metrics=loaded.metrics,
         )
 
-    @app.post("/score", response_model=ScoreResponse)
-    def score(item: ScoreRequest) -> ScoreResponse:
+    def score_json(body: bytes) -> ScoreResponse:
+        item = _validate_body(score_adapter, body)
         try:
             risk_score, risk_bucket, top_reasons = model_store.score(item.features)
         except ValueError as error:
@@ -52,34 +114,51 @@ def create_app() -> FastAPI:
             risk_score=risk_score,
             risk_bucket=risk_bucket,
             top_reasons=top_reasons,
-            model_version=(model_store.loaded or model_store.load()).model_version,
+            model_version=model_store.model_version,
             scored_at=datetime.now(timezone.utc),
         )
 
-    @app.post("/score_batch", response_model=list[ScoreResponse])
-    def score_batch(payload: BatchScoreRequest) -> list[ScoreResponse]:
-        responses: list[ScoreResponse] = []
-        loaded = model_store.loaded or model_store.load()
+    def score_batch_json(body: bytes) -> bytes:
+        payload = _validate_body(batch_adapter, body)
+
+        model_version = model_store.model_version
         scored_at = datetime.now(timezone.utc)
 
-        for item in payload.items:
-            try:
-                risk_score, risk_bucket, top_reasons = model_store.score(item.features)
-            except ValueError as error:
-                raise HTTPException(status_code=422, detail=str(error)) from error
-            responses.append(
-                ScoreResponse(
-                    drive_id=item.drive_id,
-                    day=item.day,
-                    risk_score=risk_score,
-                    risk_bucket=risk_bucket,
-                    top_reasons=top_reasons,
-                    model_version=loaded.model_version,
-                    scored_at=scored_at,
-                )
-            )
-
-        return responses
+        try:
+            scores = model_store.score_many_plain([item.features for item in payload.items])
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error)) from error
+
+        # Every value here was produced by the scorer, so the list is encoded
+        # directly in ScoreResponse field order instead of building and
+        # validating a model per item and per reason. OPT_UTC_Z matches the
+        # "Z" suffix pydantic writes for UTC datetimes.
+        return orjson.dumps(
+            [
+                {
+                    "drive_id": item.drive_id,
+                    "day": item.day,
+                    "risk_score": risk_score,
+                    "risk_bucket": risk_bucket,
+                    "top_reasons": top_reasons,
+                    "model_version": model_version,
+                    "scored_at": scored_at,
+                }
+                for item, (risk_score, risk_bucket, top_reasons) in zip(payload.items, scores, strict=True)
+            ],
+            option=orjson.OPT_UTC_Z,
+        )
+
+    # The handlers are async only to read the raw body; validation, scoring and
+    # serialization run on the thread pool like the sync handlers.
+    @app.post("/score", response_model=ScoreResponse, openapi_extra=_json_body_openapi("ScoreRequest"))
+    async def score(request: Request) -> ScoreResponse:
+        return await run_in_threadpool(score_json, await request.body())
+
+    @app.post("/score_batch", response_model=list[ScoreResponse], openapi_extra=_json_body_openapi("BatchScoreRequest"))
+    async def score_batch(request: Request) -> Response:
+        content = await run_in_threadpool(score_batch_json, await request.body())
+        return Response(content=content, media_type="application/json")
 
     return app
 
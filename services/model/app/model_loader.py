@@ -1,29 +1,86 @@
 from __future__ import annotations
 
-import json
+import math
 import os
 from dataclasses import dataclass
 from pathlib import Path
 from threading import Lock
 
-import joblib
 import numpy as np
-import pandas as pd
+import orjson
 
 from app.schemas import ReasonCode, RiskBucket
 
 
-def _risk_bucket(score: float) -> RiskBucket:
-    if score >= 0.75:
-        return RiskBucket.HIGH
-    if score >= 0.4:
-        return RiskBucket.MED
-    return RiskBucket.LOW
+# Lower bounds of MED and HIGH; np.digitize maps scores below 0.4 to 0, scores
+# in [0.4, 0.75) to 1 and the rest to 2, which index _RISK_BUCKETS. digitize
+# sorts NaN past every bound, so NaN is zeroed first to land in LOW as it did
+# with the ``>=`` comparisons.
+_RISK_THRESHOLDS = np.array([0.4, 0.75])
+_RISK_BUCKETS = (RiskBucket.LOW, RiskBucket.MED, RiskBucket.HIGH)
+
+
+def _top_reason_indices(magnitudes: np.ndarray, count: int) -> np.ndarray:
+    """Column indices of the ``count`` largest magnitudes per row, largest first.
+
+    Ties resolve to the lower column index, matching a stable descending sort.
+    """
+    rows, columns = magnitudes.shape
+    if columns <= count or rows == 1:
+        # Partitioning only pays off across many rows; a single row is cheaper
+        # to sort outright.
+        return np.argsort(-magnitudes, axis=1, kind="stable")[:, :count]
+
+    top = np.argpartition(-magnitudes, count - 1, axis=1)[:, :count]
+    top_values = np.take_along_axis(magnitudes, top, axis=1)
+    top = np.take_along_axis(top, np.lexsort((top, -top_values), axis=1), axis=1)
+
+    # argpartition picks arbitrarily among values tied at the cut-off, so rows
+    # where such a tie spills past the cut-off are re-ranked with a stable sort.
+    cutoff = top_values.min(axis=1, keepdims=True)
+    ambiguous = np.flatnonzero((magnitudes >= cutoff).sum(axis=1) > count)
+    if ambiguous.size:
+        top[ambiguous] = np.argsort(-magnitudes[ambiguous], axis=1, kind="stable")[:, :count]
+    return top
+
+
+@dataclass(frozen=True)
+class LinearWeights:
+    """Standardized logistic model read from ``weights.npz``."""
+
+    mean: np.ndarray
+    scale: np.ndarray
+    coef: np.ndarray
+    intercept: np.ndarray
+
+    @classmethod
+    def load(cls, path: Path) -> LinearWeights:
+        with np.load(path) as arrays:
+            return cls(
+                mean=np.asarray(arrays["mean"], dtype=np.float64),
+                scale=np.asarray(arrays["scale"], dtype=np.float64),
+                coef=np.asarray(arrays["coef"], dtype=np.float64).reshape(-1),
+                intercept=np.asarray(arrays["intercept"], dtype=np.float64).reshape(-1),
+            )
+
+    def predict_positive(self, values: np.ndarray) -> np.ndarray:
+        if values.shape[0] == 1:
+            # A single request is mostly call overhead, so its sigmoid is taken
+            # on a Python float instead of another round of array temporaries.
+            logit = float(((values[0] - self.mean) / self.scale) @ self.coef) + float(self.intercept[0])
+            try:
+                return np.array([1.0 / (1.0 + math.exp(-logit))])
+            except OverflowError:
+                return np.zeros(1)
+
+        logits = ((values - self.mean) / self.scale) @ self.coef + self.intercept
+        with np.errstate(over="ignore"):
+            return 1.0 / (1.0 + np.exp(-logits))
 
 
 @dataclass
 class LoadedModel:
-    model: object
+    model: object | None
     scaler: object | None
     model_type: str
     feature_columns: list[str]
@@ -32,6 +89,10 @@ class LoadedModel:
     horizon_days: int
     model_version: str
     metrics: dict[str, float | list[dict[str, float]] | str]
+    fill_vector: np.ndarray
+    weight_vector: np.ndarray
+    feature_index: dict[str, int]
+    linear: LinearWeights | None = None
 
 
 class ModelStore:
@@ -47,83 +108,165 @@ class ModelStore:
             version = self._resolve_version()
             artifact_dir = self.artifacts_root / version
 
-            bundle = joblib.load(artifact_dir / "model.joblib")
             metrics = self._load_json(artifact_dir / "metrics.json", default={})
             version_meta = self._load_json(artifact_dir / "version.json", default={})
             feature_schema = self._load_json(artifact_dir / "feature_schema.json", default={})
+            weights_path = artifact_dir / "weights.npz"
+            linear = LinearWeights.load(weights_path) if weights_path.exists() else None
+
+            # Artifacts with weights.npz score without the pickled bundle, which
+            # would import joblib and sklearn just to unpickle it.
+            if linear is not None and "model_type" in version_meta:
+                bundle: dict = {}
+            else:
+                bundle = self._load_bundle(artifact_dir)
 
             feature_columns = self._resolve_feature_columns(bundle=bundle, feature_schema=feature_schema)
             horizon_days = int(version_meta.get("horizon_days", bundle.get("horizon_days", 30)))
             model_version = str(version_meta.get("model_version", version))
+            if linear is not None:
+                if linear.coef.shape[0] != len(feature_columns):
+                    raise ValueError(
+                        f"weights.npz holds {linear.coef.shape[0]} coefficients "
+                        f"for {len(feature_columns)} features in feature_schema.json"
+                    )
+                # Fill values are the scaler means; the arrays are already in
+                # feature order.
+                fill_vector = linear.mean
+                weight_vector = linear.coef
+            else:
+                bundle_fill_values = bundle.get("fill_values", {})
+                bundle_feature_weights = bundle.get("feature_weights", {})
+                fill_vector = np.array(
+                    [float(bundle_fill_values.get(feature, 0.0)) for feature in feature_columns],
+                    dtype=np.float64,
+                )
+                weight_vector = np.array(
+                    [float(bundle_feature_weights.get(feature, 0.0)) for feature in feature_columns],
+                    dtype=np.float64,
+                )
+            fill_values = dict(zip(feature_columns, fill_vector.tolist(), strict=True))
+            feature_weights = dict(zip(feature_columns, weight_vector.tolist(), strict=True))
 
             self.loaded = LoadedModel(
-                model=bundle["model"],
+                model=bundle.get("model"),
                 scaler=bundle.get("scaler"),
-                model_type=str(bundle.get("model_type", "UnknownModel")),
+                model_type=str(version_meta.get("model_type", bundle.get("model_type", "UnknownModel"))),
                 feature_columns=feature_columns,
-                fill_values={
-                    key: float(value)
-                    for key, value in bundle.get("fill_values", {}).items()
-                },
-                feature_weights={
-                    key: float(value)
-                    for key, value in bundle.get("feature_weights", {}).items()
-                },
+                fill_values=fill_values,
+                feature_weights=feature_weights,
                 horizon_days=horizon_days,
                 model_version=model_version,
                 metrics=metrics,
+                fill_vector=fill_vector,
+                weight_vector=weight_vector,
+                feature_index={feature: index for index, feature in enumerate(feature_columns)},
+                linear=linear,
             )
             return self.loaded
 
+    @property
+    def model_version(self) -> str:
+        if self.loaded is None:
+            self.load()
+        assert self.loaded is not None
+        return self.loaded.model_version
+
     def score(
         self,
         features: dict[str, float | None],
     ) -> tuple[float, RiskBucket, list[ReasonCode]]:
+        return self.score_many([features])[0]
+
+    def score_many(
+        self,
+        rows: list[dict[str, float | None]],
+    ) -> list[tuple[float, RiskBucket, list[ReasonCode]]]:
+        return [
+            (risk_score, risk_bucket, [ReasonCode(**reason) for reason in reasons])
+            for risk_score, risk_bucket, reasons in self.score_many_plain(rows)
+        ]
+
+    def score_many_plain(
+        self,
+        rows: list[dict[str, float | None]],
+    ) -> list[tuple[float, RiskBucket, list[dict[str, str | float]]]]:
+        """Like ``score_many``, with reasons as plain ``ReasonCode``-shaped dicts.
+
+        Batch responses are serialized straight from these, without building a
+        model per reason.
+        """
         if self.loaded is None:
             self.load()
         assert self.loaded is not None
-
-        expected_keys = set(self.loaded.feature_columns)
-        provided_keys = set(features.keys())
-
-        missing = sorted(expected_keys - provided_keys)
-        extra = sorted(provided_keys - expected_keys)
-        if missing or extra:
+        loaded = self.loaded
+
+        feature_index = loaded.feature_index
+        for features in rows:
+            if features.keys() == feature_index.keys():
+                continue
+            expected_keys = set(feature_index)
+            provided_keys = set(features)
+            missing = sorted(expected_keys - provided_keys)
+            extra = sorted(provided_keys - expected_keys)
             raise ValueError(
                 "Feature schema mismatch. "
                 f"Missing keys: {missing if missing else 'none'}. "
                 f"Unexpected keys: {extra if extra else 'none'}."
             )
 
-        row = {}
-        for feature in self.loaded.feature_columns:
-            raw_value = features.get(feature)
-            if raw_value is None:
-                row[feature] = self.loaded.fill_values.get(feature, 0.0)
-            else:
-                row[feature] = float(raw_value)
-
-        frame = pd.DataFrame([row], columns=self.loaded.feature_columns)
-        model_input = frame
-        if self.loaded.scaler is not None:
-            scaled = self.loaded.scaler.transform(frame.to_numpy(dtype=np.float64))
-            model_input = pd.DataFrame(scaled, columns=self.loaded.feature_columns)
-
-        probabilities = self.loaded.model.predict_proba(model_input)
-        risk_score = float(probabilities[:, 1][0]) if probabilities.ndim > 1 else float(probabilities[0])
-
-        reasons: list[ReasonCode] = []
-        for feature_name in self.loaded.feature_columns:
-            value = float(row[feature_name])
-            weight = float(self.loaded.feature_weights.get(feature_name, 0.0))
-            contribution = float(weight * value)
-            direction = "UP" if contribution >= 0 else "DOWN"
-            reasons.append(
-                ReasonCode(code=feature_name, contribution=round(contribution, 6), direction=direction)
-            )
-
-        top_reasons = sorted(reasons, key=lambda item: abs(item.contribution), reverse=True)[:5]
-        return risk_score, _risk_bucket(risk_score), top_reasons
+        if not rows:
+            return []
+
+        # The matrix is allocated per call, since requests are scored on
+        # concurrent worker threads. Rows start as the fill values and only
+        # provided features are written over them; explicit NaNs are filled too.
+        values = np.empty((len(rows), len(loaded.feature_columns)), dtype=np.float64)
+        values[:] = loaded.fill_vector
+        for row, features in zip(values, rows):
+            for name, value in features.items():
+                if value is not None:
+                    row[feature_index[name]] = value
+        np.copyto(values, loaded.fill_vector, where=np.isnan(values))
+
+        if loaded.linear is not None:
+            risk_scores = loaded.linear.predict_positive(values)
+        else:
+            model_input = values
+            if loaded.scaler is not None:
+                model_input = loaded.scaler.transform(model_input)
+
+            probabilities = loaded.model.predict_proba(model_input)
+            risk_scores = probabilities[:, 1] if probabilities.ndim > 1 else probabilities
+
+        # Reasons rank by the rounded contribution that is reported.
+        contributions = values * loaded.weight_vector
+        rounded = np.round(contributions, 6)
+        top_indices = _top_reason_indices(np.abs(rounded), 5)
+        top_rounded = np.take_along_axis(rounded, top_indices, axis=1)
+        top_is_up = np.take_along_axis(contributions, top_indices, axis=1) >= 0
+
+        bucket_ids = np.digitize(np.nan_to_num(risk_scores, nan=0.0), _RISK_THRESHOLDS)
+
+        results: list[tuple[float, RiskBucket, list[dict[str, str | float]]]] = []
+        for row_top, row_rounded, row_is_up, risk_score, bucket_id in zip(
+            top_indices.tolist(),
+            top_rounded.tolist(),
+            top_is_up.tolist(),
+            risk_scores.tolist(),
+            bucket_ids.tolist(),
+            strict=True,
+        ):
+            reasons = [
+                {
+                    "code": loaded.feature_columns[index],
+                    "contribution": contribution,
+                    "direction": "UP" if is_up else "DOWN",
+                }
+                for index, contribution, is_up in zip(row_top, row_rounded, row_is_up)
+            ]
+            results.append((risk_score, _RISK_BUCKETS[bucket_id], reasons))
+        return results
 
     def _resolve_version(self) -> str:
         self.artifacts_root.mkdir(parents=True, exist_ok=True)
@@ -181,8 +324,16 @@ class ModelStore:
 
         raise ValueError("Unable to resolve feature columns from feature_schema.json or model bundle")
 
+    @staticmethod
+    def _load_bundle(artifact_dir: Path) -> dict:
+        import joblib
+
+        # Arrays in the bundle are memory-mapped read-only rather than copied
+        # into each worker process; scoring never mutates them.
+        return joblib.load(artifact_dir / "model.joblib", mmap_mode="r")
+
     @staticmethod
     def _load_json(path: Path, default: dict) -> dict:
         if not path.exists():
             return default
-        return json.loads(path.read_text(encoding="utf-8"))
+        return orjson.loads(path.read_bytes())
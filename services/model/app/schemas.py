@@ -2,8 +2,10 @@ from __future__ import annotations
 
 from datetime import date, datetime
 from enum import Enum
+from functools import lru_cache
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from typing_extensions import TypedDict
 
 
 class SchemaModel(BaseModel):
@@ -23,12 +25,16 @@ class ScoreRequest(SchemaModel):
 
 
 class ReasonCode(SchemaModel):
+    model_config = ConfigDict(frozen=True)
+
     code: str
     contribution: float
     direction: str
 
 
 class ScoreResponse(SchemaModel):
+    model_config = ConfigDict(frozen=True)
+
     drive_id: str
     day: date
     risk_score: float = Field(ge=0.0, le=1.0)
@@ -54,3 +60,21 @@ class ModelInfoResponse(SchemaModel):
     horizon_days: int
     features: list[str]
     metrics: dict[str, float | list[dict[str, float]] | str]
+
+
+@lru_cache(maxsize=8)
+def build_request_adapters(
+    feature_names: tuple[str, ...],
+) -> tuple[TypeAdapter[ScoreRequest], TypeAdapter[BatchScoreRequest]]:
+    """Request validators whose ``features`` is closed over the model's features.
+
+    Features validate as a TypedDict with one required ``float | None`` key per
+    feature and no extras, so a request with the wrong key set is rejected by
+    pydantic-core and valid features come out as a plain dict. Validators are
+    cached per feature tuple, so apps serving the same model share them.
+    """
+    features = TypedDict("Features", {name: float | None for name in feature_names})
+    features.__pydantic_config__ = ConfigDict(extra="forbid")
+    score_request = create_model("ScoreRequest", __base__=ScoreRequest, features=(features, ...))
+    batch_request = create_model("BatchScoreRequest", __base__=BatchScoreRequest, items=(list[score_request], ...))
+    return TypeAdapter(score_request), TypeAdapter(batch_request)
@@ -1,6 +1,22 @@
+from collections.abc import Iterator
 from pathlib import Path
 import sys
 
+import pytest
+
 MODEL_ROOT = Path(__file__).resolve().parents[1]
 if str(MODEL_ROOT) not in sys.path:
     sys.path.insert(0, str(MODEL_ROOT))
+
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator[TestClient]:
+    # One app per session: create_app loads the model and builds its request
+    # schemas, which every test can share. app.main builds an app on import,
+    # so it is only imported once a test asks for the client.
+    from app.main import create_app
+
+    with TestClient(create_app()) as test_client:
+        yield test_client
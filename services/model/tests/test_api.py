@@ -1,21 +1,23 @@
 from __future__ import annotations
 
 from datetime import date
+from functools import lru_cache
 
 from fastapi.testclient import TestClient
 
-from app.main import create_app
 
-
-def _features_from_model_info(client: TestClient) -> dict[str, float]:
+@lru_cache
+def _feature_names(client: TestClient) -> tuple[str, ...]:
     response = client.get("/model/info")
     response.raise_for_status()
-    feature_names = response.json()["features"]
-    return {name: 0.0 for name in feature_names}
+    return tuple(response.json()["features"])
+
+
+def _features_from_model_info(client: TestClient) -> dict[str, float]:
+    return {name: 0.0 for name in _feature_names(client)}
 
 
-def test_health_endpoint() -> None:
-    client = TestClient(create_app())
+def test_health_endpoint(client: TestClient) -> None:
     response = client.get("/health")
 
     assert response.status_code == 200
@@ -23,8 +25,7 @@ def test_health_endpoint() -> None:
     assert response.json()["model_loaded"] is True
 
 
-def test_score_batch_endpoint() -> None:
-    client = TestClient(create_app())
+def test_score_batch_endpoint(client: TestClient) -> None:
     features = _features_from_model_info(client)
     response = client.post(
         "/score_batch",
@@ -46,18 +47,41 @@ def test_score_batch_endpoint() -> None:
     assert payload["model_version"]
 
 
-def test_model_info_endpoint() -> None:
-    client = TestClient(create_app())
+def test_score_batch_returns_one_response_per_item(client: TestClient) -> None:
+    features = _features_from_model_info(client)
+    sparse_features = {name: None for name in features}
+    response = client.post(
+        "/score_batch",
+        json={
+            "items": [
+                {
+                    "drive_id": f"drive-{index}",
+                    "day": str(date(2026, 2, 20)),
+                    "features": features if index % 2 else sparse_features,
+                }
+                for index in range(3)
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [item["drive_id"] for item in payload] == ["drive-0", "drive-1", "drive-2"]
+    assert all(0.0 <= item["risk_score"] <= 1.0 for item in payload)
+    assert all(len(item["top_reasons"]) <= 5 for item in payload)
+
+
+def test_model_info_endpoint(client: TestClient) -> None:
     response = client.get("/model/info")
 
     assert response.status_code == 200
     assert response.json()["model_version"]
 
 
-def test_score_batch_rejects_schema_mismatch() -> None:
-    client = TestClient(create_app())
+def test_score_batch_rejects_schema_mismatch(client: TestClient) -> None:
     features = _features_from_model_info(client)
-    features.pop(next(iter(features)))
+    missing_feature = next(iter(features))
+    features.pop(missing_feature)
     features["unexpected_feature"] = 1.0
 
     response = client.post(
@@ -74,4 +98,18 @@ def test_score_batch_rejects_schema_mismatch() -> None:
     )
 
     assert response.status_code == 422
-    assert "Feature schema mismatch" in response.text
+    errors = {(error["type"], error["loc"][-1]) for error in response.json()["detail"]}
+    assert errors == {("missing", missing_feature), ("extra_forbidden", "unexpected_feature")}
+
+
+def test_openapi_documents_scoring_request_bodies(client: TestClient) -> None:
+    schema = client.get("/openapi.json").json()
+
+    for path, request_schema in [("/score", "ScoreRequest"), ("/score_batch", "BatchScoreRequest")]:
+        operation = schema["paths"][path]["post"]
+        body_schema = operation["requestBody"]["content"]["application/json"]["schema"]
+        assert body_schema["$ref"] == f"#/components/schemas/{request_schema}"
+        error_schema = operation["responses"]["422"]["content"]["application/json"]["schema"]
+        assert error_schema["$ref"] == "#/components/schemas/HTTPValidationError"
+
+    assert {"Features", "HTTPValidationError", "ValidationError"} <= set(schema["components"]["schemas"])
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+from app.model_loader import ModelStore, _top_reason_indices
+from app.schemas import RiskBucket
+
+FEATURE_COLUMNS = ["f_temp", "f_vibration", "f_power"]
+
+
+@dataclass
+class LinearArtifact:
+    root: Path
+    version_dir: Path
+    scaler: StandardScaler
+    classifier: SGDClassifier
+
+    def expected(self, rows: list[dict[str, float | None]]) -> np.ndarray:
+        # Missing features are filled with the scaler means, as the service does.
+        values = np.array(
+            [
+                [self.scaler.mean_[index] if row[name] is None else row[name] for index, name in enumerate(FEATURE_COLUMNS)]
+                for row in rows
+            ]
+        )
+        return self.classifier.predict_proba(self.scaler.transform(values))[:, 1]
+
+
+@pytest.fixture
+def linear_artifact(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> LinearArtifact:
+    # Mirrors what train_streaming writes: the joblib bundle plus weights.npz and
+    # a version.json naming the model type, so the service skips the bundle.
+    rng = np.random.default_rng(7)
+    x = rng.normal(loc=[40.0, 2.0, 150.0], scale=[5.0, 0.5, 20.0], size=(400, 3))
+    y = (x[:, 0] + 10 * x[:, 1] + rng.normal(scale=3.0, size=400) > 60.0).astype(np.int64)
+
+    scaler = StandardScaler().fit(x)
+    classifier = SGDClassifier(loss="log_loss", random_state=42).fit(scaler.transform(x), y)
+
+    version_dir = tmp_path / "linear-v1"
+    version_dir.mkdir()
+    joblib.dump(
+        {
+            "model": classifier,
+            "scaler": scaler,
+            "model_type": "SGDClassifier(log_loss)",
+            "feature_columns": FEATURE_COLUMNS,
+            "fill_values": dict(zip(FEATURE_COLUMNS, scaler.mean_.tolist())),
+            "feature_weights": dict(zip(FEATURE_COLUMNS, classifier.coef_[0].tolist())),
+            "horizon_days": 30,
+        },
+        version_dir / "model.joblib",
+    )
+    np.savez(
+        version_dir / "weights.npz",
+        coef=classifier.coef_,
+        intercept=classifier.intercept_,
+        mean=scaler.mean_,
+        scale=scaler.scale_,
+    )
+    (version_dir / "feature_schema.json").write_text(
+        json.dumps({"ordered_features": [{"name": name, "dtype": "float"} for name in FEATURE_COLUMNS]}),
+        encoding="utf-8",
+    )
+    (version_dir / "version.json").write_text(
+        json.dumps({"model_version": "linear-v1", "model_type": "SGDClassifier(log_loss)", "horizon_days": 30}),
+        encoding="utf-8",
+    )
+    (version_dir / "metrics.json").write_text(json.dumps({"pr_auc": 0.5}), encoding="utf-8")
+
+    monkeypatch.setenv("MODEL_ARTIFACTS_ROOT", str(tmp_path))
+    monkeypatch.delenv("MODEL_VERSION", raising=False)
+    return LinearArtifact(root=tmp_path, version_dir=version_dir, scaler=scaler, classifier=classifier)
+
+
+def _rows(artifact: LinearArtifact) -> list[dict[str, float | None]]:
+    # The last row pushes the logit far below exp()'s range to exercise the
+    # single-row overflow guard.
+    extreme = {
+        name: float(mean - np.sign(coef) * 1e9 * scale)
+        for name, mean, coef, scale in zip(
+            FEATURE_COLUMNS,
+            artifact.scaler.mean_,
+            artifact.classifier.coef_[0],
+            artifact.scaler.scale_,
+        )
+    }
+    return [
+        {"f_temp": 38.5, "f_vibration": 2.4, "f_power": 140.0},
+        {"f_temp": 55.0, "f_vibration": None, "f_power": 170.0},
+        {"f_temp": None, "f_vibration": None, "f_power": None},
+        extreme,
+    ]
+
+
+def test_load_scores_from_weights_without_the_bundle(linear_artifact: LinearArtifact) -> None:
+    loaded = ModelStore().load()
+
+    assert loaded.linear is not None
+    assert loaded.model is None
+    assert loaded.model_type == "SGDClassifier(log_loss)"
+    np.testing.assert_array_equal(loaded.fill_vector, linear_artifact.scaler.mean_)
+
+
+def test_score_endpoints_match_sklearn_predict_proba(linear_artifact: LinearArtifact) -> None:
+    # Imported here: app.main builds an app from MODEL_ARTIFACTS_ROOT on import,
+    # which the fixture has pointed at the linear artifact by now.
+    from app.main import create_app
+
+    rows = _rows(linear_artifact)
+    expected = linear_artifact.expected(rows)
+    assert expected[-1] == 0.0
+
+    with TestClient(create_app()) as client:
+        single = []
+        for index, features in enumerate(rows):
+            response = client.post("/score", json={"drive_id": f"drive-{index}", "day": "2026-02-20", "features": features})
+            assert response.status_code == 200
+            single.append(response.json()["risk_score"])
+
+        response = client.post(
+            "/score_batch",
+            json={
+                "items": [
+                    {"drive_id": f"drive-{index}", "day": "2026-02-20", "features": features}
+                    for index, features in enumerate(rows)
+                ]
+            },
+        )
+        assert response.status_code == 200
+        batch = [item["risk_score"] for item in response.json()]
+
+    np.testing.assert_allclose(single, expected, rtol=1e-12, atol=0.0)
+    np.testing.assert_allclose(batch, expected, rtol=1e-12, atol=0.0)
+
+
+def test_load_rejects_weights_for_a_different_feature_count(linear_artifact: LinearArtifact) -> None:
+    np.savez(
+        linear_artifact.version_dir / "weights.npz",
+        coef=np.zeros((1, len(FEATURE_COLUMNS) + 1)),
+        intercept=np.zeros(1),
+        mean=np.zeros(len(FEATURE_COLUMNS) + 1),
+        scale=np.ones(len(FEATURE_COLUMNS) + 1),
+    )
+
+    with pytest.raises(ValueError, match="coefficients"):
+        ModelStore().load()
+
+
+def test_nan_risk_score_maps_to_low_bucket(linear_artifact: LinearArtifact) -> None:
+    np.savez(
+        linear_artifact.version_dir / "weights.npz",
+        coef=linear_artifact.classifier.coef_,
+        intercept=np.array([np.nan]),
+        mean=linear_artifact.scaler.mean_,
+        scale=linear_artifact.scaler.scale_,
+    )
+    rows = _rows(linear_artifact)[:2]
+
+    for batch in (rows[:1], rows):
+        scores = ModelStore().score_many_plain(batch)
+        assert all(np.isnan(risk_score) for risk_score, _, _ in scores)
+        assert [risk_bucket for _, risk_bucket, _ in scores] == [RiskBucket.LOW] * len(batch)
+
+
+@pytest.mark.parametrize("rows", [1, 64])
+def test_top_reason_indices_breaks_ties_like_a_stable_sort(rows: int) -> None:
+    # Contributions are rounded to six decimals before ranking, so drawing from a
+    # handful of values gives plenty of ties inside, across and around the top 5.
+    rng = np.random.default_rng(11)
+    contributions = rng.choice([-0.5, -0.25, 0.0, 0.25, 0.5, 1.0], size=(rows, 12))
+    contributions[0] = [0.25, -0.5, 0.25, 0.5, -0.25, 0.25, 0.25, -1.0, 0.0, 0.25, -0.25, 0.5]
+    magnitudes = np.abs(contributions)
+
+    expected = np.argsort(-magnitudes, axis=1, kind="stable")[:, :5]
+    np.testing.assert_array_equal(_top_reason_indices(magnitudes, 5), expected)